@@ -4,14 +4,18 @@ from datetime import datetime, timezone, timedelta
 from langchain.prompts import PromptTemplate
 from langchain.chains.summarize import load_summarize_chain
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
 
 from utils import models_shared
+from utils.pdf import iter_pdf_pages
 
 def get_docs(doc_selection):
     
-    loader = PyPDFLoader(file_path=doc_selection)
-    documents = loader.load()
+    # One document per page, like PyPDFLoader, with long PDFs parsed in parallel
+    documents = [
+        Document(page_content=text, metadata={"source": doc_selection, "page": page})
+        for page, text in iter_pdf_pages(doc_selection)
+    ]
     text_splitter = RecursiveCharacterTextSplitter(
         separators=["\n\n", "\n", ".", " "], chunk_size=10000, chunk_overlap=0 
     )
@@ -25,7 +29,7 @@ def get_summary(model_id=None, temperature=0.0, return_intermediate_steps=False,
     map_prompt_template = "{text}\n\nWrite an expected list of frequently asked questions and their answers based on the above content. List each question on a new line beginning with Q:. Then leave a blank line. On a new line below that, list each answer beginning with A: "
     map_prompt = PromptTemplate(template=map_prompt_template, input_variables=["text"])
     
-    llm, is_chat = models_shared.get_llm(model_id, temperature)
+    llm, is_chat = models_shared.get_llm(model_id, temperature, rate_controlled=True) #map calls fan out; the rate controller admits them
     docs = get_docs(doc_selection=doc_selection)
     
     chain = load_summarize_chain(llm, chain_type="map_reduce", map_prompt=map_prompt, return_intermediate_steps=return_intermediate_steps)
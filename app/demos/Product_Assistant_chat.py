@@ -3,41 +3,29 @@
 # Knowledge Bases for Amazon Bedrock and LangChain 🦜️🔗
 # ------------------------------------------------------
 
-import boto3
 import logging
+import uuid
+from pathlib import Path
 
 from typing import List, Dict
 from pydantic import BaseModel
-from operator import itemgetter
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableParallel
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_aws import ChatBedrock
-from langchain_aws import AmazonKnowledgeBasesRetriever
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory
+from botocore.exceptions import NoCredentialsError
+from utils.bedrock import BedrockHandler, KBHandler
+from utils.chat_store import get_chat_store
+from utils.citation_links import get_citation_linker
+from utils.clients import RATE_CONTROLLED_CLIENT_CONFIG, get_client
+from utils.kb_catalog import get_kb_catalog
+from utils.local_kb import LocalKBHandler, LocalVectorIndex
+from utils.multi_query import llm_follow_up_suggester
+from utils.rag_chain import RETRIEVAL_MODES, ChainSettings, get_rag_chain, prefetch_retrieval
+from utils.retrieval_cache import bedrock_embedder, get_retrieval_cache
+from utils.stream_renderer import StreamRenderer
 
 # ------------------------------------------------------
 # Log level
 
 logging.getLogger().setLevel(logging.ERROR) # reduce log level
 
-
-def get_all_kbs(all_kb: dict) -> dict[str, str]:
-    """
-    Extract knowledge base names and IDs from the response.
-
-    Args:
-        all_kb (dict): The response from the list_knowledge_bases API call.
-
-    Returns:
-        Dict[str, str]: A dictionary mapping knowledge base names to their IDs.
-    """
-    result = {}
-    for kb in all_kb["knowledgeBaseSummaries"]:
-        result[kb["name"]] = kb["knowledgeBaseId"]
-    return result
-
 # ------------------------------------------------------
 # Streamlit
 
@@ -58,11 +46,18 @@ model_map = {
     "Haiku": "us.anthropic.claude-3-haiku-20240307-v1:0"
 }
 
-bedrock_agents_client = boto3.client(
-    service_name="bedrock-agent", region_name="us-east-1",
-)
+# Cached for every session and refreshed in the background once stale
+all_kbs = get_kb_catalog(region_name="us-east-1").get()
+
+# Local FAISS knowledge base built by scripts/create_local_kb.py
+LOCAL_KB_PATH = Path(__file__).parent.parent.parent / "scripts" / "local_kb"
+LOCAL_KB_NAME = "Local (FAISS)"
+if (LOCAL_KB_PATH / "index.faiss").exists():
+    all_kbs[LOCAL_KB_NAME] = LOCAL_KB_NAME
 
-all_kbs = get_all_kbs(bedrock_agents_client.list_knowledge_bases(maxResults=10))
+@st.cache_resource
+def load_local_index() -> LocalVectorIndex:
+    return LocalVectorIndex.load(str(LOCAL_KB_PATH))
 
 # Sidebar info
 with st.sidebar:
@@ -99,6 +94,10 @@ with st.sidebar:
             # MEMORY_WINDOW = st.slider("**Memory Window**", min_value=0,
             #                           max_value=10, value=10, step=1)
 
+    RETRIEVAL_MODE = st.selectbox("**Retrieval**", RETRIEVAL_MODES)
+    SUGGEST_FOLLOW_UPS = st.checkbox("**Suggest follow-ups**", value=False,
+                                     help="Ask the model for follow-up questions and pre-fetch their KB results")
+
 SELECTED_KB_ID = (
     all_kbs[KB_SELECTION]
     if KB_SELECTION != "None"
@@ -111,63 +110,51 @@ st.caption("Model: " + MODEL_ID + "  |  KB: " + KB_SELECTION)
 # ------------------------------------------------------
 # Amazon Bedrock - settings
 
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name="us-east-1",
-)
+bedrock_runtime = get_client("bedrock-runtime", region_name="us-east-1")
 
-model_kwargs = {'temperature': TEMPERATURE,
-                'top_p': TOP_P,
-                'top_k': TOP_K,
-                'max_tokens': MAX_TOKENS,
-                'stop_sequences': ["\n\nHuman"],
-                'system': SYSTEM_PROMPT}
-
-# ------------------------------------------------------
-# LangChain - RAG chain with chat history
-
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", "You are a friendly, professional chatbot."
-         "Answer the question based only on the following context:\n {context}"),
-        MessagesPlaceholder(variable_name="history"),
-        ("human", "{question}"),
-    ]
+chain_settings = ChainSettings(
+    model_id=MODEL_ID,
+    kb_id=SELECTED_KB_ID,
+    temperature=TEMPERATURE,
+    top_p=TOP_P,
+    top_k=TOP_K,
+    max_tokens=MAX_TOKENS,
+    system_prompt=SYSTEM_PROMPT,
+    retrieval_mode=RETRIEVAL_MODE,
 )
 
 # Amazon Bedrock - KnowledgeBase Retriever 
-retriever = AmazonKnowledgeBasesRetriever(
-    knowledge_base_id=SELECTED_KB_ID, # 👈 Set your Knowledge base ID
-    retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 3}},
-)
+def make_kb_handler() -> KBHandler:
+    if KB_SELECTION == LOCAL_KB_NAME:
+        local_index = load_local_index()
+        return LocalKBHandler(
+            local_index,
+            bedrock_embedder(bedrock_runtime, local_index.embedding_model or "amazon.titan-embed-text-v2:0"),
+            {"vectorSearchConfiguration": {"numberOfResults": 3}},
+            cache=get_retrieval_cache(region_name="us-east-1"),
+            lexical_index=local_index.bm25_index() if RETRIEVAL_MODE == "Hybrid" else None,
+        )
+    return KBHandler(
+        get_client("bedrock-agent-runtime", region_name="us-east-1"),
+        {"vectorSearchConfiguration": {"numberOfResults": 3}},
+        SELECTED_KB_ID, # 👈 Set your Knowledge base ID
+        cache=get_retrieval_cache(region_name="us-east-1"),
+    )
 
-model = ChatBedrock(
-    client=bedrock_runtime,
-    model_id=MODEL_ID,
-    model_kwargs=model_kwargs,
-)
+# ------------------------------------------------------
+# LangChain - RAG chain with chat history
+# Built once per distinct settings and shared by every session; reruns reuse it
 
-chain = (
-    RunnableParallel({
-        "context": itemgetter("question") | retriever,
-        "question": itemgetter("question"),
-        "history": itemgetter("history"),
-    })
-    .assign(response = prompt | model | StrOutputParser())
-    .pick(["response", "context"])
-)
+chain_with_history = get_rag_chain(chain_settings, make_kb_handler)
 
-# Streamlit Chat Message History
-history = StreamlitChatMessageHistory(key="chat_messages")
+# Chat history - one ID per browser session, kept in the URL so a reload resumes the conversation
+if "chat_session_id" not in st.session_state:
+    st.session_state.chat_session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.chat_session_id
+history = get_chat_store().get_history(st.session_state.chat_session_id)
 
-# Chain with History
-chain_with_history = RunnableWithMessageHistory(
-    chain,
-    lambda session_id: history,
-    input_messages_key="question",
-    history_messages_key="history",
-    output_messages_key="response",
-)
+# Retrieval and history reports for the current turn
+chain_reports = {}
 
 # ------------------------------------------------------
 # Pydantic data model and helper function for Citations
@@ -179,75 +166,101 @@ class Citation(BaseModel):
 def extract_citations(response: List[Dict]) -> List[Citation]:
     return [Citation(page_content=doc.page_content, metadata=doc.metadata) for doc in response]
 
-# ------------------------------------------------------
-# S3 Presigned URL
-
-def create_presigned_url(bucket_name: str, object_name: str, expiration: int = 300) -> str:
-    """Generate a presigned URL to share an S3 object"""
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.generate_presigned_url('get_object',
-                                                    Params={'Bucket': bucket_name,
-                                                            'Key': object_name},
-                                                    ExpiresIn=expiration)
-    except NoCredentialsError:
-        st.error("AWS credentials not available")
-        return ""
-    return response
-
-def parse_s3_uri(uri: str) -> tuple:
-    """Parse S3 URI to extract bucket and key"""
-    parts = uri.replace("s3://", "").split("/")
-    bucket = parts[0]
-    key = "/".join(parts[1:])
-    return bucket, key
-
 
 # Clear Chat History function
 def clear_chat_history():
     history.clear()
-    st.session_state.messages = [{"role": "assistant", "content": "How may I assist you today?"}]
+    st.session_state.earlier_messages = 0
+
+stored_messages = history.count()
 
 with st.sidebar:
     st.button('Clear Chat History', on_click=clear_chat_history)
     st.divider()
-    st.write("History Logs")
-    st.write(history.messages)
-
-# Initialize session state for messages if not already present
-if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "assistant", "content": "How may I assist you today?"}]
+    st.caption(f"History: {stored_messages} messages stored (session {st.session_state.chat_session_id[:8]})")
+
+# Older turns are only read from the store when asked for
+EARLIER_PAGE_SIZE = 20
+st.session_state.setdefault("earlier_messages", 0)
+earlier = history.load_earlier(st.session_state.earlier_messages) if st.session_state.earlier_messages else []
+recent = history.messages
+if stored_messages > len(earlier) + len(recent):
+    if st.button("Load earlier messages"):
+        st.session_state.earlier_messages += EARLIER_PAGE_SIZE
+        st.rerun()
 
 # Display chat messages
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.write(message["content"])
+with st.chat_message("assistant"):
+    st.write("How may I assist you today?")
+for message in earlier + recent:
+    with st.chat_message("user" if message.type == "human" else "assistant"):
+        st.write(message.content)
+
+def ask_follow_up(question: str):
+    st.session_state.pending_question = question
+
+def show_follow_ups():
+    # Suggested follow-ups from the last answer; their retrieval is already running
+    for i, question in enumerate(st.session_state.get("follow_ups", [])):
+        st.button(question, key=f"follow_up_{i}", on_click=ask_follow_up, args=(question,))
 
 # Chat Input - User Prompt 
-if prompt := st.chat_input():
-    st.session_state.messages.append({"role": "user", "content": prompt})
+prompt = st.chat_input() or st.session_state.pop("pending_question", None)
+if not prompt:
+    show_follow_ups()
+else:
+    # Start retrieval now so it overlaps history loading and prompt assembly
+    prefetch_retrieval(chain_settings, [prompt])
+    st.session_state.follow_ups = []
     with st.chat_message("user"):
         st.write(prompt)
 
-    config = {"configurable": {"session_id": "any"}}
+    config = {"configurable": {"message_history": history, "reports": chain_reports}}
     
     # Chain - Stream
     with st.chat_message("assistant"):
-        placeholder = st.empty()
-        full_response = ''
-        for chunk in chain_with_history.stream(
-            {"question" : prompt, "history" : history},
-            config
-        ):
-            if 'response' in chunk:
-                full_response += chunk['response']
-                placeholder.markdown(full_response)
-            else:
-                full_context = chunk['context']
-        placeholder.markdown(full_response)
+        # Re-render at a limited frame rate rather than once per chunk
+        with StreamRenderer(st.empty()) as renderer:
+            for chunk in chain_with_history.stream(
+                {"question" : prompt},
+                config
+            ):
+                if 'response' in chunk:
+                    renderer.write(chunk['response'])
+                else:
+                    full_context = chunk['context']
+        if "history" in chain_reports:
+            window = chain_reports["history"]
+            st.caption(
+                f"History: {window.tokens} tokens sent, {window.saved_tokens} tokens saved "
+                f"({window.dropped} older messages dropped)"
+            )
         # Citations with S3 pre-signed URL
         citations = extract_citations(full_context)
+        # Sign every cited S3 object for this turn in one pass; URLs are reused until near expiry
+        s3_uris = [
+            c.metadata['location']['s3Location']['uri']
+            for c in citations if c.metadata['location']['type'] == "S3"
+        ]
+        try:
+            presigned_urls = get_citation_linker().sign(s3_uris)
+        except NoCredentialsError:
+            st.error("AWS credentials not available")
+            presigned_urls = {}
         with st.expander("Show source details >"):
+            if "packed" in chain_reports:
+                packed = chain_reports["packed"]
+                st.caption(
+                    f"Context: {packed.tokens} tokens, {packed.saved_tokens} tokens saved, "
+                    f"{len(packed.dropped)} chunks dropped "
+                    f"({', '.join(reason for _, reason in packed.dropped) or 'none'})"
+                )
+            if "adaptive" in chain_reports:
+                adaptive = chain_reports["adaptive"]
+                st.caption(
+                    f"Adaptive retrieval: kept {len(adaptive.docs)} of {len(adaptive.docs) + len(adaptive.dropped)} "
+                    f"chunks (cutoff: {adaptive.reason}), {adaptive.saved_tokens} tokens saved vs. fixed top-3"
+                )
             for citation in citations:
                 st.write("Page Content:", citation.page_content)
                 # st.write("Metadata:", citation.metadata)
@@ -255,17 +268,25 @@ if prompt := st.chat_input():
                 if citation.metadata['location']['type'] == "WEB":
                     st.write("URL:", citation.metadata['location']['webLocation']['url'])
 
-                # if citation.metadata['location']:
-                #     s3_uri = citation.metadata['location']['s3Location']['uri']
-                #     bucket, key = parse_s3_uri(s3_uri)
-                #     presigned_url = create_presigned_url(bucket, key)
-                #     if presigned_url:
-                #         st.markdown(f"Source: [{s3_uri}]({presigned_url})")
-                #     else:
-                #         st.write(f"Source: {s3_uri} (Presigned URL generation failed)")
+                if citation.metadata['location']['type'] == "S3":
+                    s3_uri = citation.metadata['location']['s3Location']['uri']
+                    if s3_uri in presigned_urls:
+                        st.markdown(f"Source: [{s3_uri}]({presigned_urls[s3_uri]})")
+                    else:
+                        st.write(f"Source: {s3_uri} (Presigned URL generation failed)")
                 st.write("Score:", citation.metadata['score'])
                 st.divider()
 
-        # session_state append
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
+    if SUGGEST_FOLLOW_UPS:
+        suggest = llm_follow_up_suggester(
+            BedrockHandler(
+                get_client("bedrock-runtime", region_name="us-east-1", **RATE_CONTROLLED_CLIENT_CONFIG),
+                MODEL_ID,
+                params={"inferenceConfig": {"maxTokens": 200, "temperature": 0.0}},
+            )
+        )
+        st.session_state.follow_ups = suggest(prompt, renderer.text)
+        prefetch_retrieval(chain_settings, st.session_state.follow_ups)
+        show_follow_ups()
+
 
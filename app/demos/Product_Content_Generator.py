@@ -1,10 +1,12 @@
 import streamlit as st
-import boto3
 from botocore.exceptions import ClientError
-import PyPDF2
 import io
 from datetime import datetime, timezone, timedelta
 from utils import models_shared
+from utils.bedrock import CACHE_POINT, BedrockHandler
+from utils.history import estimate_tokens
+from utils.clients import RATE_CONTROLLED_CLIENT_CONFIG, get_client
+from utils.pdf import extract_text_cached
 
 #################
 # Streamlit App #
@@ -18,20 +20,8 @@ st.set_page_config(layout="wide", page_title="Product Content Generator", page_i
 st.title("Product Content Generator")
 st.caption("**Instructions:**  (1) Upoad PDF files (2) Choose a system prompt and customize if needed (3) Choose a user prompt and customize if needed (4) Adust LLM Parameters as needed (5) Click Generate")
 
-# Create a Bedrock Runtime client
-@st.cache_resource
-def get_bedrock_client():
-    return boto3.client("bedrock-runtime", region_name="us-east-1")
-
-client = get_bedrock_client()
-
-# Function to extract text from PDF
-def extract_text_from_pdf(pdf_file):
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+# Shared Bedrock Runtime client; BedrockHandler's rate controller retries throttled calls
+client = get_client("bedrock-runtime", region_name="us-east-1", **RATE_CONTROLLED_CLIENT_CONFIG)
 
 system_prompt_options_dict = {
 "Blank" : "",
@@ -173,7 +163,7 @@ with col2:
 pdf_texts = []
 if uploaded_files:
     for uploaded_file in uploaded_files:
-        pdf_text = extract_text_from_pdf(uploaded_file)
+        pdf_text = extract_text_cached(uploaded_file)
         pdf_texts.append(pdf_text)
 
 # Combine PDF texts
@@ -201,13 +191,32 @@ gen_button = st.button("Generate", type="primary")
 
 # Button to generate content
 if gen_button:
-    # Prepare the conversation with PDF context
-    conversation = [
-        {
-            "role": "user",
-            "content": [{"text": f"{system_prompt}\n{user_prompt}\nHere is some context from uploaded PDF files:\n\n{combined_pdf_text}"}],
-        }
-    ]
+    bedrock = BedrockHandler(
+        client,
+        selected_model,
+        params={
+            "inferenceConfig": {"maxTokens": MAX_TOKENS, "temperature": TEMPERATURE, "topP": TOP_P},
+            "additionalModelRequestFields": {}, # NOT ALL MODELS SUPPORT TOP_K
+        },
+    )
+
+    # Prepare the conversation with PDF context. Stable parts (system prompt, PDF text) come first
+    # so models that support prompt caching can reuse them across runs. Converse rejects empty text
+    # blocks, so blank parts are left out.
+    content = []
+    if system_prompt.strip():
+        content.append({"text": system_prompt})
+    if combined_pdf_text.strip():
+        content.append({"text": f"Here is some context from uploaded PDF files:\n\n{combined_pdf_text}"})
+    if user_prompt.strip():
+        content.append({"text": user_prompt})
+    elif bedrock.prompt_caching and estimate_tokens({"content": content}) >= bedrock.cache_min_tokens:
+        # No prompt: the whole message is stable, so the checkpoint goes after its last block
+        content.append(CACHE_POINT)
+    if not content:
+        st.warning("Enter a prompt or upload a PDF file to generate content.")
+        st.stop()
+    conversation = [{"role": "user", "content": content}]
 
     st.write("**GENERATED BY:** "+selected_model)
     st.write("**PARAMS:** Max Tokens ("+str(MAX_TOKENS)+") Temp ("+str(TEMPERATURE)+") Top-P ("+str(TOP_P)+")")
@@ -219,15 +228,13 @@ if gen_button:
     try:
         with st.spinner("Generating response..."):
             # Send the message to the model
-            response = client.converse(
-                modelId=selected_model,
-                messages=conversation,
-                inferenceConfig={"maxTokens": MAX_TOKENS, "temperature": TEMPERATURE, "topP": TOP_P},
-                # additionalModelRequestFields={"top_k": TOP_K} # NOT ALL MODELS SUPPORT TOP_K
-            )
+            response = bedrock.invoke_model(conversation)
 
             end = datetime.now(tzinfo)
             st.write("**TIME TO GENERATE** = " + str(end - start))
+            cache_usage = BedrockHandler.cache_usage(response)
+            if any(cache_usage.values()):
+                st.write("**PROMPT CACHE** = Read (" + str(cache_usage["cacheReadInputTokens"]) + ") Write (" + str(cache_usage["cacheWriteInputTokens"]) + ") tokens")
             # Extract and display the response text
             response_text = response["output"]["message"]["content"][0]["text"]
             st.write("**Response:**")
@@ -1,65 +1,18 @@
 import streamlit as st
-import boto3
 import json
-import base64
-from io import BytesIO
 from datetime import datetime, timezone, timedelta
 from utils import models_shared
-
-#get a BytesIO object from file bytes
-def get_bytesio_from_bytes(image_bytes):
-    image_io = BytesIO(image_bytes)
-    return image_io
-
-#get a base64-encoded string from file bytes
-def get_base64_from_bytes(image_bytes):
-    resized_io = get_bytesio_from_bytes(image_bytes)
-    img_str = base64.b64encode(resized_io.getvalue()).decode("utf-8")
-    return img_str
-
-#load the bytes from a file on disk
-def get_bytes_from_file(file_path):
-    with open(file_path, "rb") as image_file:
-        file_bytes = image_file.read()
-    return file_bytes
-
-#get the stringified request body for the InvokeModel API call
-def get_request_body(prompt, image_bytes=None, mask_prompt=None, negative_prompt=None):
-    input_image_base64 = get_base64_from_bytes(image_bytes)
-    
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 4000,
-        "temperature": 0,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg", #this doesn't seem to matter?
-                            "data": input_image_base64,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ],
-            }
-        ],
-    }
-    
-    return json.dumps(body)
+from utils.clients import RATE_CONTROLLED_CLIENT_CONFIG, get_client
+from utils.images import get_bytesio_from_bytes, get_bytes_from_file, get_request_body
+from utils.rate_control import get_rate_controller
 
 #generate a response using Anthropic Claude
 def get_response_from_model(model_id, prompt_content, image_bytes, mask_prompt=None):
-    session = boto3.Session()
-    bedrock = session.client(service_name='bedrock-runtime') #creates a Bedrock client
+    bedrock = get_client('bedrock-runtime', **RATE_CONTROLLED_CLIENT_CONFIG) #shared Bedrock client; the rate controller retries
     body = get_request_body(prompt_content, image_bytes, mask_prompt=mask_prompt)
-    response = bedrock.invoke_model(body=body, modelId=model_id, contentType="application/json", accept="application/json")
+    response = get_rate_controller(model_id).call(
+        bedrock.invoke_model, tokens=4000, body=body, modelId=model_id, contentType="application/json", accept="application/json"
+    )
     response_body = json.loads(response.get('body').read()) # read the response
     output = response_body['content'][0]['text']
     return output
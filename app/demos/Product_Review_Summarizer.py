@@ -36,7 +36,7 @@ def get_prompt(template, context=None, user_input=None):
     return prompt
 
 def get_text_response(model_id, temperature, template, context=None, user_input=None): #text-to-text client function
-    llm, is_chat = models_shared.get_llm(model_id, temperature)
+    llm, is_chat = models_shared.get_llm(model_id, temperature, rate_controlled=True) #calls are admitted by the model's rate controller, charged for the prompt and max tokens
     
     prompt = get_prompt(template, context, user_input)
     
@@ -0,0 +1,93 @@
+"""
+Chooses how many retrieved chunks to keep from the shape of their score distribution
+"""
+
+from dataclasses import dataclass, field
+
+from utils.history import estimate_text_tokens
+
+
+@dataclass
+class AdaptiveSelection:
+    """
+    The result of an adaptive cutoff over retrieval results.
+
+    Attributes:
+        docs (list[dict]): The kept documents, best first.
+        dropped (list[dict]): The over-fetched documents below the cutoff.
+        reason (str): What set the cutoff ("elbow", "ratio", "min", "max" or "all").
+        tokens (int): The estimated tokens of the kept documents.
+        baseline_tokens (int): The estimated tokens a fixed numberOfResults would have sent.
+    """
+
+    docs: list = field(default_factory=list)
+    dropped: list = field(default_factory=list)
+    reason: str = "all"
+    tokens: int = 0
+    baseline_tokens: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        """
+        Tokens saved against the fixed baseline; negative when a hard question kept more chunks.
+        """
+        return self.baseline_tokens - self.tokens
+
+
+def select_by_score(
+    docs: list[dict],
+    min_results: int = 1,
+    max_results: int = 8,
+    min_ratio: float = 0.75,
+    elbow_factor: float = 2.0,
+    baseline_k: int = 3,
+) -> AdaptiveSelection:
+    """
+    Keep the results before the score distribution falls off. The cutoff is the first of:
+    a score below `min_ratio` of the best score, or an elbow, a gap between consecutive scores
+    at least `elbow_factor` times the average gap. The number kept stays within
+    [min_results, max_results].
+
+    Args:
+        docs (list[dict]): Over-fetched retrieval results with a "score".
+        min_results (int, optional): The fewest results to keep. Defaults to 1.
+        max_results (int, optional): The most results to keep. Defaults to 8.
+        min_ratio (float, optional): The lowest score, relative to the best, worth keeping. Defaults to 0.75.
+        elbow_factor (float, optional): How much larger than average a gap must be to count as an elbow.
+                                        Defaults to 2.0.
+        baseline_k (int, optional): The fixed numberOfResults the savings are measured against. Defaults to 3.
+
+    Returns:
+        AdaptiveSelection: The kept and dropped documents and the token savings.
+    """
+    ranked = sorted(docs, key=lambda doc: doc.get("score", 0.0), reverse=True)
+    scores = [doc.get("score", 0.0) for doc in ranked[:max_results]]
+    cut, reason = len(scores), "all" if len(ranked) <= max_results else "max"
+
+    if scores and scores[0] > 0:
+        for i, score in enumerate(scores):
+            if score < scores[0] * min_ratio:
+                cut, reason = i, "ratio"
+                break
+
+    gaps = [scores[i] - scores[i + 1] for i in range(len(scores) - 1)]
+    if gaps and sum(gaps) > 0:
+        average = sum(gaps) / len(gaps)
+        for i, gap in enumerate(gaps[:cut - 1]):
+            if gap >= elbow_factor * average:
+                cut, reason = i + 1, "elbow"
+                break
+
+    if cut < min_results:
+        cut, reason = min(min_results, len(ranked)), "min"
+
+    def tokens(selected: list[dict]) -> int:
+        return sum(estimate_text_tokens(doc["content"]["text"]) for doc in selected)
+
+    return AdaptiveSelection(
+        docs=ranked[:cut],
+        dropped=ranked[cut:],
+        reason=reason,
+        tokens=tokens(ranked[:cut]),
+        baseline_tokens=tokens(ranked[:baseline_k]),
+    )
@@ -0,0 +1,249 @@
+"""
+Content-addressed storage for files attached to Bedrock messages
+"""
+
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+IMAGE_FORMATS = ["png", "jpeg", "gif", "webp"]
+DOCUMENT_FORMATS = ["pdf", "csv", "doc", "docx", "xls", "xlsx", "html", "txt", "md"]
+
+# Converse API limits per content block
+MAX_IMAGE_BYTES = int(3.75 * 1024 * 1024)
+MAX_DOCUMENT_BYTES = int(4.5 * 1024 * 1024)
+
+
+class AttachmentTooLargeError(ValueError):
+    """
+    Thrown when an attachment exceeds the size Bedrock accepts for its content type
+    """
+
+    pass
+
+
+@dataclass(frozen=True)
+class Attachment:
+    """
+    A single uploaded file, identified by the SHA-256 digest of its content.
+
+    Attributes:
+        digest (str): The hex SHA-256 digest of the file content.
+        name (str): The original file name.
+        format (str): The Converse API format (e.g. "png", "pdf").
+        data (bytes): The file content. Shared by every message that references this attachment.
+    """
+
+    digest: str
+    name: str
+    format: str
+    data: bytes
+
+    @property
+    def is_image(self) -> bool:
+        return self.format in IMAGE_FORMATS
+
+    @property
+    def document_name(self) -> str:
+        """
+        A document name that is unique per content and valid for the Converse API
+        (alphanumerics, whitespace, hyphens, parentheses and square brackets only).
+        """
+        stem = re.sub(r"[^A-Za-z0-9\s\-\(\)\[\]]", "-", Path(self.name).stem)
+        stem = re.sub(r"\s+", " ", stem).strip() or "document"
+        return f"{stem[:48]}-{self.digest[:12]}"
+
+    def content_block(self) -> dict:
+        """
+        Build the Converse API content block for this attachment.
+
+        Returns:
+            dict: An "image" or "document" content block.
+        """
+        if self.is_image:
+            return {"image": {"format": self.format, "source": {"bytes": self.data}}}
+        return {
+            "document": {
+                "format": self.format,
+                "name": self.document_name,
+                "source": {"bytes": self.data},
+            }
+        }
+
+    def reference_block(self) -> dict:
+        """
+        Build a text block that points back to an earlier copy of this attachment in the conversation.
+
+        Returns:
+            dict: A "text" content block.
+        """
+        kind = "image" if self.is_image else "document"
+        return {
+            "text": f"(The {kind} '{self.name}' [{self.digest[:12]}] was attached earlier in this conversation.)"
+        }
+
+
+class AttachmentStore:
+    """
+    Hashes each uploaded file once and tracks which attachments were already sent in a conversation.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty AttachmentStore.
+        """
+        self._by_digest = {}
+        self._by_upload = {}
+        self._sent = set()
+        self._references = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _format_for(file_name: str) -> Optional[str]:
+        extension = Path(file_name).suffix[1:].lower()
+        if extension == "jpg":
+            extension = "jpeg"
+        if extension in IMAGE_FORMATS or extension in DOCUMENT_FORMATS:
+            return extension
+        return None
+
+    @staticmethod
+    def _view(uploaded_file) -> memoryview:
+        """
+        Get a view of the file content without copying it when the upload supports the buffer protocol
+        (Streamlit's UploadedFile is a BytesIO).
+        """
+        if hasattr(uploaded_file, "getbuffer"):
+            return uploaded_file.getbuffer()
+        if hasattr(uploaded_file, "getvalue"):
+            return memoryview(uploaded_file.getvalue())
+        uploaded_file.seek(0)
+        return memoryview(uploaded_file.read())
+
+    def add(self, uploaded_file) -> Optional[Attachment]:
+        """
+        Register an uploaded file, hashing it only the first time it is seen.
+
+        Args:
+            uploaded_file: A file-like object with a `name` attribute, such as a Streamlit UploadedFile.
+
+        Returns:
+            Attachment: The attachment for the file, or None if its format is not supported.
+
+        Raises:
+            AttachmentTooLargeError: If the file exceeds the Converse API size limit for its type.
+        """
+        file_format = self._format_for(uploaded_file.name)
+        if file_format is None:
+            return None
+
+        # Streamlit gives every upload a stable file_id, which lets reruns skip hashing entirely
+        upload_key = getattr(uploaded_file, "file_id", None)
+        if upload_key is not None:
+            with self._lock:
+                attachment = self._by_upload.get(upload_key)
+            if attachment is not None:
+                return attachment
+
+        view = self._view(uploaded_file)
+        try:
+            limit = MAX_IMAGE_BYTES if file_format in IMAGE_FORMATS else MAX_DOCUMENT_BYTES
+            if view.nbytes > limit:
+                raise AttachmentTooLargeError(
+                    f"'{uploaded_file.name}' is {view.nbytes:,} bytes; the limit for {file_format} is {limit:,} bytes"
+                )
+            digest = hashlib.sha256(view).hexdigest()
+            with self._lock:
+                attachment = self._by_digest.get(digest)
+                if attachment is None:
+                    attachment = Attachment(
+                        digest=digest,
+                        name=uploaded_file.name,
+                        format=file_format,
+                        data=view.tobytes(),
+                    )
+                    self._by_digest[digest] = attachment
+                if upload_key is not None:
+                    self._by_upload[upload_key] = attachment
+        finally:
+            view.release()
+        return attachment
+
+    def content_blocks(self, uploaded_files: list) -> list[dict]:
+        """
+        Build content blocks for a new message, referencing attachments already sent by digest.
+
+        Args:
+            uploaded_files (list): The files attached to the new message.
+
+        Returns:
+            list[dict]: The content blocks to append to the message.
+        """
+        blocks = []
+        in_message = set()
+        for uploaded_file in uploaded_files:
+            attachment = self.add(uploaded_file)
+            if attachment is None or attachment.digest in in_message:
+                continue
+            in_message.add(attachment.digest)
+            with self._lock:
+                already_sent = attachment.digest in self._sent
+                self._sent.add(attachment.digest)
+            if already_sent:
+                block = attachment.reference_block()
+                with self._lock:
+                    self._references[block["text"]] = attachment
+            else:
+                block = attachment.content_block()
+            blocks.append(block)
+        return blocks
+
+    def resolve_references(self, messages: list[dict]) -> list[dict]:
+        """
+        Replace references to attachments that are not carried by any of the given messages with the
+        attachments themselves. The Converse API is stateless, so a reference only holds while the
+        message that carried the file is part of the same request; a history window may have dropped it.
+
+        Args:
+            messages (list[dict]): The Converse API messages of one request, oldest first.
+
+        Returns:
+            list[dict]: The messages, with dangling references inlined at their first occurrence.
+        """
+        # Every block built from an attachment shares its bytes object, so identity finds them cheaply
+        present = set()
+        for message in messages:
+            for block in message["content"]:
+                source = (block.get("image") or block.get("document") or {}).get("source")
+                if source is not None:
+                    present.add(id(source["bytes"]))
+
+        resolved = []
+        for message in messages:
+            content = []
+            for block in message["content"]:
+                with self._lock:
+                    attachment = self._references.get(block.get("text"))
+                if attachment is not None and id(attachment.data) not in present:
+                    present.add(id(attachment.data))
+                    block = attachment.content_block()
+                content.append(block)
+            resolved.append({**message, "content": content})
+        return resolved
+
+    def forget_sent(self, digest: Optional[str] = None) -> None:
+        """
+        Mark an attachment (or all attachments) as no longer present in the conversation,
+        for example after the message that carried it was dropped from the history.
+
+        Args:
+            digest (str, optional): The digest to forget. Defaults to None (forget all).
+        """
+        with self._lock:
+            if digest is None:
+                self._sent.clear()
+            else:
+                self._sent.discard(digest)
@@ -2,10 +2,73 @@
 Handles communication to Bedrock and KnowledgeBases
 """
 
+import asyncio
 import base64
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from typing import Optional
-from pathlib import Path
+
+from utils.adaptive_retrieval import AdaptiveSelection, select_by_score
+from utils.attachments import AttachmentStore
+from utils.bm25 import BM25Index
+from utils.context_packer import pack_context
+from utils.history import estimate_text_tokens, estimate_tokens
+from utils.multi_query import IDENTIFIER_PATTERN, STOPWORDS, expand_query, reciprocal_rank_fusion, result_key
+from utils.rate_control import RateController, get_rate_controller
+from utils.response_cache import ResponseCache, request_key
+from utils.rerank import Reranker
+from utils.retrieval_cache import RetrievalCache, normalize_query
+from utils.streaming import ConverseTextStream
+
+
+# Minimum prefix length (in tokens) for a prompt cache checkpoint, by model family.
+# Models not listed here do not support prompt caching.
+PROMPT_CACHE_MIN_TOKENS = {
+    "anthropic.claude-3-5-haiku": 2048,
+    "anthropic.claude-3-7-sonnet": 1024,
+    "anthropic.claude-sonnet-4": 1024,
+    "anthropic.claude-opus-4": 1024,
+    "amazon.nova": 1024,
+}
+MAX_CACHE_POINTS = 4
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def get_prompt_cache_min_tokens(model_id: str) -> Optional[int]:
+    """
+    Look up the minimum cacheable prefix length for a model.
+
+    Args:
+        model_id (str): The Bedrock model ID, with or without a cross-region prefix such as "us.".
+
+    Returns:
+        int: The minimum number of tokens before a checkpoint, or None if the model does not support prompt caching.
+    """
+    for prefix, min_tokens in PROMPT_CACHE_MIN_TOKENS.items():
+        if prefix in model_id:
+            return min_tokens
+    return None
+
+
+@dataclass
+class BatchResult:
+    """
+    The outcome of a single item in a batch of Bedrock calls.
+
+    Attributes:
+        index (int): The position of the item in the input batch.
+        response (dict, optional): The response from the Bedrock model, if the call succeeded.
+        error (Exception, optional): The exception raised by the call, if it failed.
+    """
+
+    index: int
+    response: Optional[dict] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class BedrockHandler:
@@ -13,18 +76,45 @@ class BedrockHandler:
     A class to handle interactions with Bedrock models and manage messages.
     """
 
-    def __init__(self, client, model_id: str, params: dict):
+    def __init__(
+        self,
+        client,
+        model_id: str,
+        params: dict,
+        cache: Optional[ResponseCache] = None,
+        system_prompt: Optional[str] = None,
+        prompt_caching: Optional[bool] = None,
+        rate_controller: Optional[RateController] = None,
+    ):
         """
         Initialize the BedrockHandler with a client, model ID, and parameters.
 
         Args:
             client: The Bedrock client object.
             model_id (str): The ID of the Bedrock model to use.
-            params (dict): The parameters for the model.
+            params (dict): The parameters for the model. "inferenceConfig" and "additionalModelRequestFields"
+                           override the request defaults when present.
+            cache (ResponseCache, optional): A cache for `invoke_model` responses. Defaults to None (no caching).
+            system_prompt (str, optional): A system prompt sent with every request. Defaults to None.
+            prompt_caching (bool, optional): Place Bedrock prompt cache checkpoints after stable prefixes.
+                                             Defaults to None (enabled when the model supports it).
+            rate_controller (RateController, optional): Admission control and retries for Bedrock calls.
+                                                        Defaults to the process-wide controller for the model.
+                                                        Create `client` with RATE_CONTROLLED_CLIENT_CONFIG so
+                                                        that only the controller retries.
         """
         self.params = params
         self.model_id = model_id
         self.client = client
+        self.cache = cache
+        self.system_prompt = system_prompt
+        self.cache_min_tokens = get_prompt_cache_min_tokens(model_id)
+        self.prompt_caching = (
+            self.cache_min_tokens is not None if prompt_caching is None else prompt_caching
+        )
+        if self.prompt_caching and self.cache_min_tokens is None:
+            self.cache_min_tokens = min(PROMPT_CACHE_MIN_TOKENS.values())
+        self.rate_controller = rate_controller or get_rate_controller(model_id)
 
     @staticmethod
     def assistant_message(message: str) -> dict:
@@ -44,58 +134,140 @@ class BedrockHandler:
         message: str,
         context: Optional[str] = None,
         uploaded_files: Optional[list] = None,
+        attachments: Optional[AttachmentStore] = None,
     ) -> dict:
         """
-        Create a message dictionary representing a user's query, optionally including context and uploaded images.
+        Create a message dictionary representing a user's query, optionally including context and uploaded files.
+
+        Stable content (context and attachments) comes before the question so that it can be reused as a
+        cached prompt prefix.
 
         Args:
             message (str): The text content of the user's query.
             context (str, optional): The context information to include in the message. Defaults to None.
-            uploaded_pics (list, optional): A list of uploaded image files. Defaults to None.
+            uploaded_files (list, optional): A list of uploaded image or document files. Defaults to None.
+            attachments (AttachmentStore, optional): The attachment store for the conversation. Files already sent
+                                                     in the conversation are referenced by digest instead of being
+                                                     sent again. Defaults to None (a store scoped to this message).
 
         Returns:
             dict: A message dictionary with the role set to "user" and the content containing the provided message,
-                  context (if available), and base64-encoded image data (if provided).
+                  context (if available), and image/document content blocks (if provided).
+
+        Raises:
+            AttachmentTooLargeError: If an uploaded file exceeds the Converse API size limit for its type.
         """
-        context_message = (
-            f"You are a helpful assistant, answer the following question based on the provided context: \n\n {context} \n\n "
-            if context
-            else ""
-        )
-        new_message = {
-            "role": "user",
-            "content": [{"text": f"{context_message} question: {message}"}],
-        }
+        new_message = {"role": "user", "content": []}
+        if context:
+            new_message["content"].append(
+                {
+                    "text": f"You are a helpful assistant, answer the following question based on the provided context: \n\n {context} \n\n "
+                }
+            )
         if uploaded_files:
-            for uploaded_file in uploaded_files:
-                bytes_data = uploaded_file.read()
-                extension = Path(uploaded_file.name).suffix[1:]
-                print(extension)
-                if extension in ["png", "jpeg", "gif", "webp"]:
-                    new_message["content"].append(
-                        {
-                            "image": {
-                                "format": extension,
-                                "source": {
-                                    "bytes": bytes_data,
-                                },
-                            }
-                        }
-                    )
-                elif extension in ["pdf", "csv", "doc", "docx", "xls", "xlsx", "html", "txt","md"]:
-                    new_message["content"].append(
-                        {
-                            "document": {
-                                "format": extension,
-                                "name": "random-doc-name",
-                                "source": {
-                                    "bytes": bytes_data,
-                                },
-                            }
-                        }
-                    )
+            if attachments is None:
+                attachments = AttachmentStore()
+            new_message["content"].extend(attachments.content_blocks(uploaded_files))
+        new_message["content"].append({"text": f"question: {message}"})
         return new_message
 
+    @staticmethod
+    def cache_usage(response: dict) -> dict:
+        """
+        Extract prompt cache token counts from a `converse` response or a stream summary usage dict.
+
+        Args:
+            response (dict): The response from the Bedrock model, or its "usage" dictionary.
+
+        Returns:
+            dict: The cache read and write token counts (0 when caching was not used).
+        """
+        usage = response.get("usage", response)
+        return {
+            "cacheReadInputTokens": usage.get("cacheReadInputTokens", 0),
+            "cacheWriteInputTokens": usage.get("cacheWriteInputTokens", 0),
+        }
+
+    def _add_cache_points(self, system: Optional[list], messages: list) -> tuple[Optional[list], list]:
+        """
+        Insert prompt cache checkpoints after the stable prefixes of a request: the system prompt,
+        the end of the prior turns, and the context/attachments of the latest message.
+
+        A checkpoint is only placed when the prefix before it is long enough for the model to cache.
+        Checkpoints already in the latest message (e.g. after its last block, when the whole message is
+        stable) are kept and count against the limit. The caller's messages are not modified.
+
+        Args:
+            system (list, optional): The system content blocks.
+            messages (list): A list of message dictionaries containing the conversation history.
+
+        Returns:
+            tuple[list, list]: The system blocks and messages with checkpoints added.
+        """
+        budget = MAX_CACHE_POINTS
+        prefix_tokens = 0
+        if system:
+            prefix_tokens = sum(estimate_text_tokens(block.get("text", "")) for block in system)
+            if prefix_tokens >= self.cache_min_tokens:
+                system = [*system, CACHE_POINT]
+                budget -= 1
+
+        messages = list(messages)
+        placed = messages and CACHE_POINT in messages[-1]["content"]
+        if placed:
+            budget -= messages[-1]["content"].count(CACHE_POINT)
+        for i, message in enumerate(messages):
+            prefix_tokens += estimate_tokens(message)
+            if budget <= 0:
+                break
+            if i == len(messages) - 2 and prefix_tokens >= self.cache_min_tokens:
+                # End of the prior turns
+                messages[i] = {**message, "content": [*message["content"], CACHE_POINT]}
+                budget -= 1
+            elif i == len(messages) - 1 and len(message["content"]) > 1 and not placed:
+                # Everything in the latest message except the trailing question
+                question_tokens = estimate_tokens({"content": message["content"][-1:]})
+                if prefix_tokens - question_tokens >= self.cache_min_tokens:
+                    content = message["content"]
+                    messages[i] = {**message, "content": [*content[:-1], CACHE_POINT, content[-1]]}
+                    budget -= 1
+        return system, messages
+
+    def _build_request(self, messages: list) -> dict:
+        """
+        Build the keyword arguments shared by `converse` and `converse_stream`.
+
+        Args:
+            messages (list): A list of message dictionaries containing the conversation history.
+
+        Returns:
+            dict: The request keyword arguments.
+        """
+        system = [{"text": self.system_prompt}] if self.system_prompt else None
+        if self.prompt_caching:
+            system, messages = self._add_cache_points(system, messages)
+
+        request = {
+            "modelId": self.model_id,
+            "messages": messages,
+            "inferenceConfig": self.params.get("inferenceConfig", {"temperature": 0.0}),
+        }
+        additional_fields = self.params.get("additionalModelRequestFields", {"top_k": 100})
+        if additional_fields:
+            request["additionalModelRequestFields"] = additional_fields
+        if system:
+            request["system"] = system
+        return request
+
+    def _call(self, api, request: dict) -> dict:
+        """
+        Send a request through the rate controller, charging its estimated input and output tokens.
+        """
+        tokens = sum(estimate_tokens(message) for message in request["messages"])
+        tokens += sum(estimate_text_tokens(block.get("text", "")) for block in request.get("system", []))
+        tokens += request["inferenceConfig"].get("maxTokens", 0)
+        return self.rate_controller.call(api, tokens=tokens, **request)
+
     def invoke_model(self, messages: list) -> dict:
         """
         Invoke the Bedrock model with the provided messages and return the response.
@@ -106,12 +278,113 @@ class BedrockHandler:
         Returns:
             dict: The response from the Bedrock model.
         """
-        return self.client.converse(
-            modelId=self.model_id,
-            messages=messages,
-            inferenceConfig={"temperature": 0.0},
-            additionalModelRequestFields={"top_k": 100},
-        )
+        request = self._build_request(messages)
+        if self.cache is None:
+            return self._call(self.client.converse, request)
+
+        key = request_key(**request)
+        response = self.cache.get(key)
+        if response is None:
+            response = self._call(self.client.converse, request)
+            self.cache.set(key, response)
+        return response
+
+    def _invoke_batch_item(self, index: int, messages: list) -> BatchResult:
+        try:
+            return BatchResult(index=index, response=self.invoke_model(messages))
+        except Exception as e:  # collected per item so one failure doesn't abort the batch
+            return BatchResult(index=index, error=e)
+
+    def invoke_model_batch(
+        self,
+        messages_batch: list[list],
+        max_concurrency: int = 8,
+        ordered: bool = True,
+    ) -> list[BatchResult]:
+        """
+        Invoke the Bedrock model for many conversations concurrently using a thread pool.
+
+        Args:
+            messages_batch (list[list]): A list of conversations, each a list of message dictionaries.
+            max_concurrency (int, optional): The maximum number of in-flight requests. Defaults to 8.
+            ordered (bool, optional): Return results in input order if True, otherwise in completion order.
+                                      Defaults to True.
+
+        Returns:
+            list[BatchResult]: One result per conversation. Failed items carry the raised exception in `error`.
+        """
+        return list(self.iter_model_batch(messages_batch, max_concurrency, ordered))
+
+    def iter_model_batch(
+        self,
+        messages_batch: list[list],
+        max_concurrency: int = 8,
+        ordered: bool = True,
+    ):
+        """
+        Invoke the Bedrock model for many conversations concurrently, yielding results as they become available.
+
+        Args:
+            messages_batch (list[list]): A list of conversations, each a list of message dictionaries.
+            max_concurrency (int, optional): The maximum number of in-flight requests. Defaults to 8.
+            ordered (bool, optional): Yield results in input order if True, otherwise as they complete.
+                                      Defaults to True.
+
+        Yields:
+            BatchResult: The result for each conversation.
+
+        Closing the iterator early (e.g. breaking out of the loop) cancels the requests that have not
+        started yet; requests already in flight finish in the background.
+        """
+        if not messages_batch:
+            return
+        executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+        try:
+            futures = [
+                executor.submit(self._invoke_batch_item, i, messages)
+                for i, messages in enumerate(messages_batch)
+            ]
+            if ordered:
+                for future in futures:
+                    yield future.result()
+            else:
+                for future in as_completed(futures):
+                    yield future.result()
+        finally:
+            # Not a `with` block: its shutdown(wait=True) would run every queued request before returning
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def ainvoke_model_batch(
+        self,
+        messages_batch: list[list],
+        max_concurrency: int = 8,
+        ordered: bool = True,
+    ) -> list[BatchResult]:
+        """
+        Invoke the Bedrock model for many conversations concurrently from asyncio code.
+
+        The boto3 client is blocking, so each call runs in the default executor while a
+        semaphore caps the number of in-flight requests.
+
+        Args:
+            messages_batch (list[list]): A list of conversations, each a list of message dictionaries.
+            max_concurrency (int, optional): The maximum number of in-flight requests. Defaults to 8.
+            ordered (bool, optional): Return results in input order if True, otherwise in completion order.
+                                      Defaults to True.
+
+        Returns:
+            list[BatchResult]: One result per conversation. Failed items carry the raised exception in `error`.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(index: int, messages: list) -> BatchResult:
+            async with semaphore:
+                return await asyncio.to_thread(self._invoke_batch_item, index, messages)
+
+        tasks = [run(i, messages) for i, messages in enumerate(messages_batch)]
+        if ordered:
+            return list(await asyncio.gather(*tasks))
+        return [await task for task in asyncio.as_completed(tasks)]
 
     def invoke_model_with_stream(self, messages: list) -> dict:
         """
@@ -123,12 +396,20 @@ class BedrockHandler:
         Returns:
             dict: The streaming response from the Bedrock model.
         """
-        return self.client.converse_stream(
-            modelId=self.model_id,
-            messages=messages,
-            inferenceConfig={"temperature": 0.0},
-            additionalModelRequestFields={"top_k": 100},
-        )
+        return self._call(self.client.converse_stream, self._build_request(messages))
+
+    def stream_text(self, messages: list) -> ConverseTextStream:
+        """
+        Invoke the Bedrock model with streaming and iterate the response as text deltas.
+
+        Args:
+            messages (list): A list of message dictionaries containing the conversation history.
+
+        Returns:
+            ConverseTextStream: An iterable of text deltas. Its `summary` holds the stop reason, token usage,
+                                time to first token, total latency and tokens per second once iteration ends.
+        """
+        return ConverseTextStream(lambda: self.invoke_model_with_stream(messages))
 
 
 class KBHandler:
@@ -136,7 +417,17 @@ class KBHandler:
     A class to handle interactions with Bedrock knowledge bases and retrieve relevant documents.
     """
 
-    def __init__(self, client, kb_params: dict, kb_id: Optional[str] = None):
+    # Bedrock knowledge bases are updated by ingestion jobs, which the retrieval cache watches
+    checks_ingestion = True
+
+    def __init__(
+        self,
+        client,
+        kb_params: dict,
+        kb_id: Optional[str] = None,
+        cache: Optional[RetrievalCache] = None,
+        lexical_index: Optional[BM25Index] = None,
+    ):
         """
         Initialize the KBHandler with a client, knowledge base parameters, and an optional knowledge base ID.
 
@@ -144,42 +435,200 @@ class KBHandler:
             client: The Bedrock client object.
             kb_params (dict): The parameters for the knowledge base.
             kb_id (str, optional): The ID of the knowledge base to use. Defaults to None.
+            cache (RetrievalCache, optional): A cache for retrieval results. Defaults to None (no caching).
+            lexical_index (BM25Index, optional): A local BM25 index over the same chunks, used by hybrid
+                                                 retrieval. Defaults to None.
         """
         self.client = client
         self.kb_id = kb_id
         self.params = kb_params
+        self.cache = cache
+        self.lexical_index = lexical_index
 
-    def get_relevant_docs(self, prompt: str) -> list[dict]:
+    def get_relevant_docs(self, prompt: str, number_of_results: Optional[int] = None) -> list[dict]:
         """
         Retrieve relevant documents from the knowledge base based on the provided prompt.
 
         Args:
             prompt (str): The prompt or query to search for relevant documents.
+            number_of_results (int, optional): Override the configured numberOfResults. Defaults to None.
 
         Returns:
             list[dict]: A list of dictionaries representing the retrieved documents.
         """
-        return (
-            self.client.retrieve(
-                retrievalQuery={"text": prompt},
-                knowledgeBaseId=self.kb_id,
-                retrievalConfiguration=self.params,
-            )["retrievalResults"]
-            if self.kb_id
-            else []
-        )
+        if number_of_results is None:
+            return self._get_relevant_docs(prompt)
+        return self._get_relevant_docs(prompt, numberOfResults=number_of_results)
+
+    def _get_relevant_docs(self, prompt: str, **search) -> list[dict]:
+        if not self.kb_id:
+            return []
+        params = self.params
+        if search:
+            params = {**params, "vectorSearchConfiguration": {**params.get("vectorSearchConfiguration", {}), **search}}
+        if self.cache is not None:
+            return self.cache.get_or_retrieve(
+                self.kb_id,
+                params,
+                prompt,
+                lambda query: self._retrieve(query, params),
+                check_ingestion=self.checks_ingestion,
+            )
+        return self._retrieve(prompt, params)
+
+    def get_relevant_docs_adaptive(
+        self,
+        prompt: str,
+        min_results: int = 1,
+        max_results: int = 8,
+        min_ratio: float = 0.75,
+    ) -> AdaptiveSelection:
+        """
+        Over-fetch `max_results` documents and keep only those before the score distribution falls off
+        (see `select_by_score`), so easy questions send fewer chunks and hard ones more.
+
+        Args:
+            prompt (str): The prompt or query to search for relevant documents.
+            min_results (int, optional): The fewest documents to keep. Defaults to 1.
+            max_results (int, optional): The number of documents to fetch and the most to keep. Defaults to 8.
+            min_ratio (float, optional): The lowest score, relative to the best, worth keeping. Defaults to 0.75.
+
+        Returns:
+            AdaptiveSelection: The kept documents and the tokens saved against the configured numberOfResults.
+        """
+        baseline_k = self.params.get("vectorSearchConfiguration", {}).get("numberOfResults", 5)
+        docs = self.get_relevant_docs(prompt, number_of_results=max_results)
+        return select_by_score(docs, min_results, max_results, min_ratio=min_ratio, baseline_k=baseline_k)
+
+    def get_relevant_docs_hybrid(
+        self,
+        prompt: str,
+        limit: Optional[int] = None,
+        fetch_k: Optional[int] = None,
+    ) -> list[dict]:
+        """
+        Retrieve documents by fusing vector search with BM25 keyword search, so exact SKUs, part numbers
+        and model names are found even when their embeddings are not close to the question's.
+
+        With a local `lexical_index`, chunks that contain an identifier from the prompt verbatim are ranked up,
+        and a prompt made only of identifiers is answered from the index without a retrieve call. Without
+        one, the knowledge base's own hybrid search is used.
+
+        Args:
+            prompt (str): The prompt or query to search for relevant documents.
+            limit (int, optional): The maximum number of documents to return. Defaults to the configured
+                                   numberOfResults.
+            fetch_k (int, optional): The number of candidates to take from each search. Defaults to twice `limit`.
+
+        Returns:
+            list[dict]: The documents, best first. Fused results have an added "fusedScore".
+        """
+        if limit is None:
+            limit = self.params.get("vectorSearchConfiguration", {}).get("numberOfResults", 5)
+        if self.lexical_index is None:
+            return self._get_relevant_docs(prompt, numberOfResults=limit, overrideSearchType="HYBRID")
+        fetch_k = fetch_k or 2 * limit
+
+        exact = []
+        seen = set()
+        for identifier in IDENTIFIER_PATTERN.findall(prompt):
+            for chunk in self.lexical_index.exact_matches(identifier, limit):
+                result = BM25Index.to_result(chunk, 1.0)
+                key = result_key(result)
+                if key not in seen:
+                    seen.add(key)
+                    exact.append(result)
+        remainder = [w for w in normalize_query(IDENTIFIER_PATTERN.sub(" ", prompt)).split() if w not in STOPWORDS]
+        if exact and not remainder:
+            return exact[:limit]
+
+        lexical = [BM25Index.to_result(chunk, score) for chunk, score in self.lexical_index.search(prompt, fetch_k)]
+        vector = self.get_relevant_docs(prompt, number_of_results=fetch_k)
+        # Exact identifier hits are fused as one more ranking: a boost, not a guaranteed slot
+        return reciprocal_rank_fusion([vector, lexical, exact], limit=limit)
+
+    def get_relevant_docs_reranked(
+        self,
+        prompt: str,
+        fetch_k: int = 20,
+        top_k: Optional[int] = None,
+        reranker: Optional[Reranker] = None,
+    ) -> list[dict]:
+        """
+        Over-fetch candidates from the knowledge base and rerank them locally, keeping the best `top_k`.
+
+        Args:
+            prompt (str): The prompt or query to search for relevant documents.
+            fetch_k (int, optional): The number of candidates to retrieve. Defaults to 20.
+            top_k (int, optional): The number of documents to return. Defaults to the configured numberOfResults.
+            reranker (Reranker, optional): The reranker to use. Defaults to a lexical plus hashed n-gram Reranker.
+
+        Returns:
+            list[dict]: The reranked documents, best first, each with an added "rerankScore".
+        """
+        if top_k is None:
+            top_k = self.params.get("vectorSearchConfiguration", {}).get("numberOfResults", 5)
+        candidates = self.get_relevant_docs(prompt, number_of_results=max(fetch_k, top_k))
+        return (reranker or Reranker()).rerank(prompt, candidates, top_k)
+
+    def get_relevant_docs_multi(
+        self,
+        prompt: str,
+        max_queries: int = 4,
+        expander=None,
+        limit: Optional[int] = None,
+        max_concurrency: int = 4,
+    ) -> list[dict]:
+        """
+        Retrieve documents for several expansions of the prompt concurrently and fuse the rankings
+        with reciprocal rank fusion, keeping each chunk once.
+
+        Args:
+            prompt (str): The prompt or query to search for relevant documents.
+            max_queries (int, optional): The maximum number of sub-queries, including the prompt. Defaults to 4.
+            expander (callable, optional): Returns extra queries for the prompt, e.g. `llm_query_expander`.
+                                           Defaults to None (rule-based expansion only).
+            limit (int, optional): The maximum number of documents to return. Defaults to the configured
+                                   numberOfResults.
+            max_concurrency (int, optional): The maximum number of parallel retrieve calls. Defaults to 4.
+
+        Returns:
+            list[dict]: The fused documents, best first, each with an added "fusedScore".
+        """
+        if not self.kb_id:
+            return []
+        queries = expand_query(prompt, max_queries)
+        if expander is not None:
+            queries = list(dict.fromkeys(queries + expander(prompt)))[:max_queries]
+        if limit is None:
+            limit = self.params.get("vectorSearchConfiguration", {}).get("numberOfResults")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(queries)))) as executor:
+            rankings = list(executor.map(self.get_relevant_docs, queries))
+        return reciprocal_rank_fusion(rankings, limit=limit)
+
+    def _retrieve(self, prompt: str, params: Optional[dict] = None) -> list[dict]:
+        return self.client.retrieve(
+            retrievalQuery={"text": prompt},
+            knowledgeBaseId=self.kb_id,
+            retrievalConfiguration=params or self.params,
+        )["retrievalResults"]
 
     @staticmethod
-    def parse_kb_output_to_string(docs: list[dict]) -> str:
+    def parse_kb_output_to_string(docs: list[dict], max_tokens: Optional[int] = None) -> str:
         """
         Parse the retrieved documents into a string format.
 
         Args:
             docs (list[dict]): A list of dictionaries representing the retrieved documents.
+            max_tokens (int, optional): Pack the documents into this many tokens first, dropping duplicate and
+                                        overlapping text (see `pack_context`). Defaults to None (keep everything).
 
         Returns:
             str: A string containing the content of the retrieved documents, separated by newlines.
         """
+        if max_tokens is not None:
+            docs = pack_context(docs, max_tokens).docs
         return "\n\n".join(
             f"Document {i + 1}: {doc['content']['text']}" for i, doc in enumerate(docs)
         )
@@ -0,0 +1,190 @@
+"""
+In-memory BM25 inverted index for exact-term retrieval over knowledge base chunks
+"""
+
+import re
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Whole tokens keep inner "-", ".", "/" so SKUs and part numbers like "AB-1200/X" stay intact
+TOKEN_PATTERN = re.compile(r"\w+(?:[\-./]\w+)*")
+PART_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split text into lower-case index terms. Compound identifiers are kept whole and also
+    indexed by their parts, so "AB-1200" matches both "ab-1200" and "1200".
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list[str]: The terms, in order.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class _Postings:
+    """
+    The documents containing a term, as compact parallel arrays. New postings are appended to
+    small Python lists and merged into the arrays on the next search.
+    """
+
+    __slots__ = ("doc_ids", "freqs", "_pending_ids", "_pending_freqs")
+
+    def __init__(self):
+        self.doc_ids = np.empty(0, dtype=np.uint32)
+        self.freqs = np.empty(0, dtype=np.uint16)
+        self._pending_ids = []
+        self._pending_freqs = []
+
+    def append(self, doc_id: int, freq: int) -> None:
+        self._pending_ids.append(doc_id)
+        self._pending_freqs.append(min(freq, np.iinfo(np.uint16).max))
+
+    def compact(self) -> None:
+        if self._pending_ids:
+            self.doc_ids = np.concatenate([self.doc_ids, np.asarray(self._pending_ids, dtype=np.uint32)])
+            self.freqs = np.concatenate([self.freqs, np.asarray(self._pending_freqs, dtype=np.uint16)])
+            self._pending_ids = []
+            self._pending_freqs = []
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) + len(self._pending_ids)
+
+
+class BM25Index:
+    """
+    A BM25 index over text chunks that can be extended incrementally. Results are returned in the
+    same `retrievalResults` shape as the Bedrock Knowledge Base.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Initialize the BM25Index.
+
+        Args:
+            k1 (float, optional): The term frequency saturation. Defaults to 1.2.
+            b (float, optional): The length normalization. Defaults to 0.75.
+        """
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        self._postings = {}
+        self._lengths = np.empty(0, dtype=np.uint32)
+        self._pending_lengths = []
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def add(self, texts: list[str], sources: list[str]) -> None:
+        """
+        Index more chunks.
+
+        Args:
+            texts (list[str]): The chunk texts.
+            sources (list[str]): The source URI of each chunk.
+        """
+        with self._lock:
+            for text, source in zip(texts, sources):
+                doc_id = len(self.chunks)
+                terms = tokenize(text)
+                counts = {}
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, freq in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        self._postings[term] = postings = _Postings()
+                    postings.append(doc_id, freq)
+                self.chunks.append({"text": text, "source": source})
+                self._pending_lengths.append(len(terms))
+                self._total_length += len(terms)
+
+    def _compact_lengths(self) -> None:
+        if self._pending_lengths:
+            self._lengths = np.concatenate([self._lengths, np.asarray(self._pending_lengths, dtype=np.uint32)])
+            self._pending_lengths = []
+
+    def search(self, query: str, k: int) -> list[tuple[dict, float]]:
+        """
+        Find the chunks with the highest BM25 score for a query.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of results.
+
+        Returns:
+            list[tuple[dict, float]]: Chunk metadata and BM25 score, best first.
+        """
+        with self._lock:
+            if not self.chunks:
+                return []
+            self._compact_lengths()
+            count = len(self.chunks)
+            average_length = self._total_length / count or 1
+            doc_ids, weights = [], []
+            for term in dict.fromkeys(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                postings.compact()
+                idf = np.log1p((count - len(postings) + 0.5) / (len(postings) + 0.5))
+                freqs = postings.freqs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[postings.doc_ids] / average_length)
+                doc_ids.append(postings.doc_ids)
+                weights.append(idf * freqs * (self.k1 + 1) / (freqs + norm))
+            if not doc_ids:
+                return []
+            ids = np.concatenate(doc_ids)
+            scores = np.bincount(ids, weights=np.concatenate(weights))
+            matched = np.unique(ids)
+            best = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+            return [(self.chunks[i], float(scores[i])) for i in best]
+
+    def exact_matches(self, term: str, limit: Optional[int] = None) -> list[dict]:
+        """
+        Look up the chunks containing a term verbatim (e.g. a SKU), most occurrences first.
+
+        Args:
+            term (str): The term.
+            limit (int, optional): The maximum number of chunks. Defaults to None (all).
+
+        Returns:
+            list[dict]: The matching chunk metadata.
+        """
+        with self._lock:
+            postings = self._postings.get(term.lower())
+            if postings is None:
+                return []
+            postings.compact()
+            order = np.argsort(-postings.freqs, kind="stable")[:limit]
+            return [self.chunks[i] for i in postings.doc_ids[order]]
+
+    @staticmethod
+    def to_result(chunk: dict, score: float) -> dict:
+        """
+        Convert a chunk into a knowledge base retrieval result.
+        """
+        source = chunk["source"]
+        if source.startswith("s3://"):
+            location = {"type": "S3", "s3Location": {"uri": source}}
+        else:
+            location = {"type": "LOCAL", "localLocation": {"uri": source}}
+        return {
+            "content": {"text": chunk["text"]},
+            "location": location,
+            "score": score,
+            "metadata": {"x-amz-bedrock-kb-source-uri": source},
+        }
@@ -0,0 +1,222 @@
+"""
+SQLite-backed chat history shared by every Streamlit session, with bounded memory per session
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from utils.history import DEFAULT_HISTORY_TOKEN_BUDGET, ConversationHistory
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent.parent / "data" / "chat_history.db"
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """
+    The chat history of one session. Every message is written to SQLite; only the most recent
+    messages are kept in memory, and older turns are loaded a page at a time on request.
+
+    The in-memory messages are mirrored in `conversation`, a ConversationHistory that counts each
+    message's tokens once as it is added, for trimming the history sent to the model.
+    """
+
+    def __init__(self, store: "ChatStore", session_id: str, max_messages: int):
+        """
+        Initialize the SQLiteChatMessageHistory. Use `ChatStore.get_history` rather than calling this directly.
+
+        Args:
+            store (ChatStore): The store that owns the database.
+            session_id (str): The session ID.
+            max_messages (int): The number of recent messages kept in memory.
+        """
+        self.store = store
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._recent = None
+        self._first_seq = None
+        self._next_seq = None
+        self._conversation = ConversationHistory(max_tokens=DEFAULT_HISTORY_TOKEN_BUDGET)
+
+    def _load(self) -> None:
+        if self._recent is None:
+            rows = self.store._fetch(self.session_id, None, self.max_messages)
+            self._recent = messages_from_dict([json.loads(message) for _, message in rows])
+            self._first_seq = rows[0][0] if rows else 0
+            self._next_seq = rows[-1][0] + 1 if rows else 0
+            self._conversation.clear()
+            self._conversation.extend(self._recent)
+
+    @property
+    def conversation(self) -> ConversationHistory:
+        """
+        The in-memory messages as a ConversationHistory. Set its `max_tokens` before calling `window`.
+        """
+        with self._lock:
+            self._load()
+            return self._conversation
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        """
+        The most recent messages, oldest first. Older messages stay on disk (see `load_earlier`).
+        """
+        with self._lock:
+            self._load()
+            return list(self._recent)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with self._lock:
+            self._load()
+            rows = []
+            for message in messages:
+                rows.append((self.session_id, self._next_seq, json.dumps(message_to_dict(message)), time.time()))
+                self._next_seq += 1
+            self.store._insert(rows)
+            self._recent.extend(messages)
+            self._conversation.extend(messages)
+            if len(self._recent) > self.max_messages:
+                dropped = len(self._recent) - self.max_messages
+                del self._recent[:dropped]
+                self._conversation.drop_oldest(dropped)
+                self._first_seq += dropped
+
+    def load_earlier(self, count: int) -> list[BaseMessage]:
+        """
+        Load messages older than the ones held in memory, for showing earlier turns.
+
+        Args:
+            count (int): The number of older messages to load.
+
+        Returns:
+            list[BaseMessage]: Up to `count` messages preceding `messages`, oldest first.
+        """
+        with self._lock:
+            self._load()
+            first_seq = self._first_seq
+        rows = self.store._fetch(self.session_id, first_seq, count)
+        return messages_from_dict([json.loads(message) for _, message in rows])
+
+    def count(self) -> int:
+        """
+        The number of messages stored for the session, including those not in memory.
+        """
+        return self.store._count(self.session_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.store._delete(self.session_id)
+            self._recent = []
+            self._conversation.clear()
+            self._first_seq = 0
+            self._next_seq = 0
+
+
+class ChatStore:
+    """
+    Holds the chat histories of all sessions in one SQLite database (WAL mode, so readers don't block
+    the writer). Histories of sessions that have been idle are dropped from memory and reloaded
+    from disk on their next use.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_messages: int = 40, idle_seconds: float = 900):
+        """
+        Initialize the ChatStore.
+
+        Args:
+            db_path (str, optional): The path of the SQLite file. Defaults to $CHAT_STORE_PATH or data/chat_history.db.
+            max_messages (int, optional): The number of recent messages kept in memory per session. Defaults to 40.
+            idle_seconds (float, optional): How long an unused session stays in memory. Defaults to 900.
+        """
+        self.db_path = str(db_path or os.environ.get("CHAT_STORE_PATH") or DEFAULT_DB_PATH)
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+        self._histories = {}
+        self._lock = threading.Lock()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _fetch(self, session_id: str, before_seq: Optional[int], limit: int) -> list[tuple[int, str]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, message FROM messages WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq if before_seq is not None else 2 ** 62, limit),
+            ).fetchall()
+        return rows[::-1]
+
+    def _insert(self, rows: list[tuple]) -> None:
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO messages (session_id, seq, message, created) VALUES (?, ?, ?, ?)", rows)
+
+    def _count(self, session_id: str) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def _delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def get_history(self, session_id: str) -> SQLiteChatMessageHistory:
+        """
+        Get the history of a session, evicting histories that have been idle too long.
+
+        Args:
+            session_id (str): The session ID.
+
+        Returns:
+            SQLiteChatMessageHistory: The session's history.
+        """
+        now = time.time()
+        with self._lock:
+            for idle_id in [s for s, (_, used) in self._histories.items() if now - used > self.idle_seconds]:
+                del self._histories[idle_id]
+            history = self._histories.get(session_id, (None, None))[0]
+            if history is None:
+                history = SQLiteChatMessageHistory(self, session_id, self.max_messages)
+            self._histories[session_id] = (history, now)
+            return history
+
+    def active_sessions(self) -> int:
+        with self._lock:
+            return len(self._histories)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chat_store() -> ChatStore:
+    """
+    Get the process-wide ChatStore, shared by every Streamlit session.
+
+    Returns:
+        ChatStore: The store.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatStore()
+        return _store
@@ -0,0 +1,113 @@
+"""
+Presigned S3 links for knowledge base citations, signed per turn and cached until near expiry
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from utils.clients import get_client
+
+
+@lru_cache(maxsize=4096)
+def parse_s3_uri(uri: str) -> tuple[str, str]:
+    """
+    Parse an S3 URI into its bucket and key.
+
+    Args:
+        uri (str): The URI, e.g. "s3://bucket/path/to/file.pdf".
+
+    Returns:
+        tuple[str, str]: The bucket and the key.
+    """
+    bucket, _, key = uri.removeprefix("s3://").partition("/")
+    return bucket, key
+
+
+class CitationLinker:
+    """
+    Signs GET URLs for cited S3 objects with one shared client and reuses each URL until
+    shortly before it expires.
+    """
+
+    def __init__(self, client, expiration: int = 300, refresh_margin: int = 60, max_entries: int = 2048):
+        """
+        Initialize the CitationLinker.
+
+        Args:
+            client: The S3 client object.
+            expiration (int, optional): The lifetime of a signed URL in seconds. Defaults to 300.
+            refresh_margin (int, optional): Re-sign URLs with less than this many seconds left. Defaults to 60.
+            max_entries (int, optional): The maximum number of URLs cached. Defaults to 2048.
+        """
+        self.client = client
+        self.expiration = expiration
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sign(self, uris: Iterable[str]) -> dict[str, str]:
+        """
+        Get presigned URLs for all the S3 URIs cited in a turn.
+
+        Args:
+            uris (Iterable[str]): The S3 URIs. Duplicates are signed once.
+
+        Returns:
+            dict[str, str]: The presigned URL for each URI.
+
+        Raises:
+            NoCredentialsError: If no AWS credentials are available for signing.
+        """
+        now = time.time()
+        links = {}
+        missing = []
+        with self._lock:
+            for uri in dict.fromkeys(uris):
+                entry = self._urls.get(parse_s3_uri(uri))
+                if entry is not None and entry[1] - now > self.refresh_margin:
+                    self._urls.move_to_end(parse_s3_uri(uri))
+                    links[uri] = entry[0]
+                else:
+                    missing.append(uri)
+
+        signed = {}
+        for uri in missing:
+            bucket, key = parse_s3_uri(uri)
+            signed[(bucket, key)] = self.client.generate_presigned_url(
+                "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=self.expiration
+            )
+            links[uri] = signed[(bucket, key)]
+
+        with self._lock:
+            for location, url in signed.items():
+                self._urls[location] = (url, now + self.expiration)
+                self._urls.move_to_end(location)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return links
+
+
+_linkers = {}
+_linkers_lock = threading.Lock()
+
+
+def get_citation_linker(region_name: Optional[str] = None) -> CitationLinker:
+    """
+    Get the process-wide CitationLinker for a region, shared by every Streamlit session.
+
+    Args:
+        region_name (str, optional): The AWS region. Defaults to None (the session's default region).
+
+    Returns:
+        CitationLinker: The linker.
+    """
+    with _linkers_lock:
+        linker = _linkers.get(region_name)
+        if linker is None:
+            linker = CitationLinker(get_client("s3", region_name=region_name))
+            _linkers[region_name] = linker
+        return linker
@@ -0,0 +1,92 @@
+"""
+Process-wide registry of boto3 clients with tuned connection pooling
+"""
+
+import threading
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+
+from utils.simulator import SIMULATED_SERVICES, BedrockSimulator, SimulatorConfig, simulator_enabled
+
+# Defaults applied to every client unless overridden in get_client
+DEFAULT_CLIENT_CONFIG = {
+    "max_pool_connections": 50,
+    "tcp_keepalive": True,
+    "connect_timeout": 5,
+    "read_timeout": 120,
+    "retries": {"mode": "standard", "max_attempts": 3},
+}
+
+# For clients whose calls go through a RateController. The controller owns retries for those calls:
+# botocore retrying first would multiply the attempts and hide throttles from the controller's AIMD limit.
+RATE_CONTROLLED_CLIENT_CONFIG = {"retries": {"mode": "standard", "total_max_attempts": 1}}
+
+_session = None
+_simulator = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def get_client(service_name: str, region_name: Optional[str] = None, **config):
+    """
+    Get a shared boto3 client, creating it on first use.
+
+    boto3 clients are thread-safe, so one client per (service, region, config) is reused by every
+    page and Streamlit session in the process, keeping its connection pool warm. When the
+    BEDROCK_SIMULATOR environment variable is set, Bedrock services get the offline simulator instead.
+
+    Args:
+        service_name (str): The AWS service, e.g. "bedrock-runtime".
+        region_name (str, optional): The AWS region. Defaults to None (the session's default region).
+        **config: botocore Config options that override DEFAULT_CLIENT_CONFIG
+                  (max_pool_connections, connect_timeout, read_timeout, retries, ...).
+
+    Returns:
+        The boto3 client.
+    """
+    global _session, _simulator
+    if service_name in SIMULATED_SERVICES and simulator_enabled():
+        with _lock:
+            if _simulator is None:
+                _simulator = BedrockSimulator(SimulatorConfig.from_env(), region_name or "us-east-1")
+            return _simulator
+
+    options = {**DEFAULT_CLIENT_CONFIG, **config}
+    key = (service_name, region_name, _freeze(options))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # boto3 sessions are not thread-safe, so clients are only ever created under the lock
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(
+                service_name=service_name,
+                region_name=region_name,
+                config=Config(**options),
+            )
+            _clients[key] = client
+        return client
+
+
+def clear_clients() -> None:
+    """
+    Drop all cached clients, e.g. after credentials or configuration change.
+    """
+    global _session, _simulator
+    with _lock:
+        _clients.clear()
+        _session = None
+        _simulator = None
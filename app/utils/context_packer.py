@@ -0,0 +1,147 @@
+"""
+Packs retrieved chunks into a token budget, removing duplicate and overlapping text
+"""
+
+import re
+from dataclasses import dataclass, field
+
+from utils.history import estimate_text_tokens
+
+SHINGLE_SIZE = 5
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def _shingles(words: list[str]) -> set:
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _overlap_length(previous: list[str], current: list[str], min_words: int = 8) -> int:
+    """
+    Length of the longest suffix of `previous` that is also a prefix of `current`, as produced by
+    fixed-size chunking with overlap.
+    """
+    if not current:
+        return 0
+    longest = min(len(previous), len(current))
+    # Only positions where the first word of `current` appears can start an overlap
+    for start in range(len(previous) - longest, len(previous) - min_words + 1):
+        if previous[start] == current[0] and previous[start:] == current[:len(previous) - start]:
+            return len(previous) - start
+    return 0
+
+
+@dataclass
+class PackedContext:
+    """
+    The result of packing retrieved documents into a budget.
+
+    Attributes:
+        docs (list[dict]): The kept documents in packing order. Text may be trimmed.
+        tokens (int): The estimated tokens of the kept text.
+        dropped (list[tuple[dict, str]]): Each dropped document with the reason
+                                          ("duplicate", "contained", "budget").
+        trimmed_tokens (int): Tokens removed from kept documents (overlaps and the final cut).
+    """
+
+    docs: list = field(default_factory=list)
+    tokens: int = 0
+    dropped: list = field(default_factory=list)
+    trimmed_tokens: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.trimmed_tokens + sum(
+            estimate_text_tokens(doc["content"]["text"]) for doc, _ in self.dropped
+        )
+
+
+def pack_context(
+    docs: list[dict],
+    max_tokens: int,
+    duplicate_threshold: float = 0.8,
+    mmr_lambda: float = 0.7,
+    min_tail_tokens: int = 50,
+) -> PackedContext:
+    """
+    Select retrieved documents for a prompt: drop near-duplicates and chunks contained in others,
+    order the rest by maximal marginal relevance (score balanced against similarity to chunks already
+    chosen), strip text that overlaps an already chosen chunk, and trim to the token budget.
+
+    Args:
+        docs (list[dict]): Retrieval results with "content" and an optional "score".
+        max_tokens (int): The token budget for the packed text.
+        duplicate_threshold (float, optional): The shingle similarity at which a chunk counts as a duplicate.
+                                               Defaults to 0.8.
+        mmr_lambda (float, optional): Weight of relevance versus diversity (1.0 = score order only). Defaults to 0.7.
+        min_tail_tokens (int, optional): The smallest partial chunk worth keeping at the end of the budget.
+                                         Defaults to 50.
+
+    Returns:
+        PackedContext: The kept documents, their token count and what was dropped.
+    """
+    packed = PackedContext()
+    candidates = []
+    for doc in docs:
+        # Word spans let trimmed chunks be cut from the original text, keeping its line breaks and layout
+        spans = [m.span() for m in WORD_PATTERN.finditer(doc["content"]["text"])]
+        words = [doc["content"]["text"][start:end] for start, end in spans]
+        candidates.append(
+            {"doc": doc, "words": words, "spans": spans, "shingles": _shingles(words), "score": doc.get("score", 0.0)}
+        )
+
+    # Normalize scores to [0, 1] so they are comparable with similarities
+    scores = [c["score"] for c in candidates]
+    low, high = (min(scores), max(scores)) if scores else (0, 0)
+    for c in candidates:
+        c["relevance"] = (c["score"] - low) / (high - low) if high > low else 1.0
+
+    selected = []
+    remaining = sorted(candidates, key=lambda c: c["score"], reverse=True)
+    while remaining:
+        best, best_value, best_similarity = None, None, 0.0
+        for c in remaining:
+            similarity = 0.0
+            for s in selected:
+                union = len(c["shingles"] | s["shingles"]) or 1
+                similarity = max(similarity, len(c["shingles"] & s["shingles"]) / union)
+            value = mmr_lambda * c["relevance"] - (1 - mmr_lambda) * similarity
+            if best_value is None or value > best_value:
+                best, best_value, best_similarity = c, value, similarity
+        remaining.remove(best)
+
+        if best_similarity >= duplicate_threshold:
+            packed.dropped.append((best["doc"], "duplicate"))
+            continue
+        if any(best["shingles"] and best["shingles"] <= s["shingles"] for s in selected):
+            packed.dropped.append((best["doc"], "contained"))
+            continue
+
+        first, last = 0, len(best["words"])
+        for s in selected:
+            first += _overlap_length(s["words"], best["words"][first:last])
+            last -= _overlap_length(best["words"][first:last], s["words"])
+        if first >= last:
+            packed.dropped.append((best["doc"], "contained"))
+            continue
+        text = best["doc"]["content"]["text"]
+        if first > 0 or last < len(best["words"]):
+            text = text[best["spans"][first][0]:best["spans"][last - 1][1]]
+        tokens = estimate_text_tokens(text)
+        original_tokens = estimate_text_tokens(best["doc"]["content"]["text"])
+
+        available = max_tokens - packed.tokens
+        if tokens > available:
+            if available < min_tail_tokens:
+                packed.dropped.append((best["doc"], "budget"))
+                continue
+            # Keep as many whole words as fit
+            text = text[:available * 4].rsplit(None, 1)[0]
+            tokens = estimate_text_tokens(text)
+
+        selected.append(best)
+        packed.tokens += tokens
+        packed.trimmed_tokens += max(original_tokens - tokens, 0)
+        packed.docs.append({**best["doc"], "content": {**best["doc"]["content"], "text": text}})
+    return packed
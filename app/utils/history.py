@@ -0,0 +1,278 @@
+"""
+Keeps conversation history inside a per-model token budget
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from utils.attachments import AttachmentStore
+
+# Rough per-attachment costs used when estimating without a tokenizer
+IMAGE_TOKENS = 1600
+DOCUMENT_BYTES_PER_TOKEN = 8
+
+# History budgets by model family; leaves room for the system prompt, retrieved context and the reply
+HISTORY_TOKEN_BUDGETS = {
+    "anthropic.claude-3": 16000,
+    "amazon.titan-text-premier": 8000,
+    "amazon.titan-text-express": 2000,
+    "amazon.titan-text-lite": 1000,
+    "meta.llama3": 2000,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 2000
+
+
+def get_history_budget(model_id: str) -> int:
+    """
+    Look up the history token budget for a model.
+
+    Args:
+        model_id (str): The Bedrock model ID, with or without a cross-region prefix such as "us.".
+
+    Returns:
+        int: The number of tokens the conversation history may use.
+    """
+    for prefix, budget in HISTORY_TOKEN_BUDGETS.items():
+        if prefix in model_id:
+            return budget
+    return DEFAULT_HISTORY_TOKEN_BUDGET
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Estimate the token count of a string (about four characters per token for English text).
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def estimate_tokens(message) -> int:
+    """
+    Estimate the token count of a Converse API message dictionary or a LangChain message.
+
+    Args:
+        message: A dict with a "content" list of blocks, or an object with a `content` attribute.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    content = message["content"] if isinstance(message, dict) else message.content
+    if isinstance(content, str):
+        return estimate_text_tokens(content)
+    tokens = 0
+    for block in content:
+        if isinstance(block, str):
+            tokens += estimate_text_tokens(block)
+        elif "text" in block:
+            tokens += estimate_text_tokens(block["text"])
+        elif "image" in block:
+            tokens += IMAGE_TOKENS
+        elif "document" in block:
+            tokens += len(block["document"]["source"]["bytes"]) // DOCUMENT_BYTES_PER_TOKEN
+    return tokens
+
+
+def _role(message) -> str:
+    if isinstance(message, dict):
+        return message["role"]
+    return "user" if message.type == "human" else "assistant"
+
+
+@dataclass
+class HistoryWindow:
+    """
+    The part of the history selected for one request.
+
+    Attributes:
+        messages (list): The messages to send, oldest first.
+        summary (str, optional): A summary of the turns that were dropped, if a summarizer is configured.
+        tokens (int): The estimated tokens of the selected messages and summary.
+        total_tokens (int): The estimated tokens of the full history.
+        dropped (int): The number of messages left out of the window.
+    """
+
+    messages: list = field(default_factory=list)
+    summary: Optional[str] = None
+    tokens: int = 0
+    total_tokens: int = 0
+    dropped: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.total_tokens - self.tokens
+
+
+class ConversationHistory:
+    """
+    A conversation history that counts tokens once per message and trims to a budget on each turn.
+
+    Older turns fall out of a sliding window. If a summarizer is provided, the dropped turns are
+    folded into a rolling summary so that only newly dropped turns are summarized on each call.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        summarizer: Optional[Callable[[Optional[str], list], str]] = None,
+        token_counter: Callable = estimate_tokens,
+        attachments: Optional[AttachmentStore] = None,
+    ):
+        """
+        Initialize the ConversationHistory.
+
+        Args:
+            max_tokens (int): The token budget for the history sent with each request.
+            summarizer (callable, optional): Called as `summarizer(previous_summary, dropped_messages)` and
+                                             returns the new summary text. Defaults to None (window only).
+            token_counter (callable, optional): Estimates the tokens of one message. Defaults to `estimate_tokens`.
+            attachments (AttachmentStore, optional): The store that built the messages' attachment blocks. References
+                                                     to files in dropped messages are inlined again in
+                                                     `converse_messages`. Defaults to None.
+        """
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        self.attachments = attachments
+        self.messages = []
+        self._tokens = []
+        self._total_tokens = 0
+        self._summary = None
+        self._summarized = 0
+        self.last_window = None
+
+    @classmethod
+    def for_model(cls, model_id: str, **kwargs) -> "ConversationHistory":
+        """
+        Create a ConversationHistory with the budget configured for a model.
+
+        Args:
+            model_id (str): The Bedrock model ID.
+            **kwargs: Passed through to the constructor.
+
+        Returns:
+            ConversationHistory: The new history.
+        """
+        return cls(max_tokens=get_history_budget(model_id), **kwargs)
+
+    def append(self, message) -> None:
+        """
+        Add a message to the history, counting its tokens once.
+
+        Args:
+            message: A Converse API message dictionary or a LangChain message.
+        """
+        tokens = self.token_counter(message)
+        self.messages.append(message)
+        self._tokens.append(tokens)
+        self._total_tokens += tokens
+
+    def extend(self, messages: list) -> None:
+        for message in messages:
+            self.append(message)
+
+    def drop_oldest(self, count: int) -> None:
+        """
+        Remove the oldest messages, e.g. when the store backing the history stops holding them in memory.
+        With a summarizer, they are folded into the rolling summary first.
+
+        Args:
+            count (int): The number of messages to remove.
+        """
+        count = min(count, len(self.messages))
+        if self.summarizer is not None:
+            self._fold(count)
+        self._total_tokens -= sum(self._tokens[:count])
+        del self.messages[:count]
+        del self._tokens[:count]
+        self._summarized = max(0, self._summarized - count)
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self._tokens.clear()
+        self._total_tokens = 0
+        self._summary = None
+        self._summarized = 0
+        self.last_window = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self._total_tokens
+
+    def _window_start(self, budget: int) -> int:
+        start = len(self.messages)
+        used = 0
+        while start > 0 and used + self._tokens[start - 1] <= budget:
+            start -= 1
+            used += self._tokens[start]
+        # Always keep the latest message, and start the window on a user turn as the Converse API requires
+        start = min(start, len(self.messages) - 1) if self.messages else 0
+        while start < len(self.messages) - 1 and _role(self.messages[start]) != "user":
+            start += 1
+        return start
+
+    def _fold(self, start: int) -> None:
+        if start > self._summarized:
+            self._summary = self.summarizer(self._summary, self.messages[self._summarized:start])
+            self._summarized = start
+
+    def window(self) -> HistoryWindow:
+        """
+        Select the most recent messages that fit the budget, summarizing the rest if configured.
+
+        Returns:
+            HistoryWindow: The selected messages, optional summary and token accounting for this turn.
+        """
+        total = self.total_tokens
+        start = self._window_start(self.max_tokens)
+
+        summary = None
+        if self.summarizer is not None and start > 0:
+            start = max(start, self._summarized)
+            self._fold(start)
+            # Make room for the summary by sliding the window forward if needed
+            refit = self._window_start(self.max_tokens - estimate_text_tokens(self._summary or ""))
+            if refit > start:
+                start = refit
+                self._fold(start)
+            summary = self._summary
+
+        tokens = sum(self._tokens[start:]) + estimate_text_tokens(summary or "")
+        self.last_window = HistoryWindow(
+            messages=self.messages[start:],
+            summary=summary,
+            tokens=tokens,
+            total_tokens=total,
+            dropped=start,
+        )
+        return self.last_window
+
+    def converse_messages(self) -> list[dict]:
+        """
+        Build the message list for a Converse API request from the current window.
+
+        The rolling summary, if any, is prepended as a text block of the first user message. With an
+        attachment store, files whose original message fell out of the window are sent again in place
+        of their reference.
+
+        Returns:
+            list[dict]: The messages to pass to `converse`.
+        """
+        window = self.window()
+        messages = list(window.messages)
+        if self.attachments is not None:
+            messages = self.attachments.resolve_references(messages)
+        if window.summary and messages:
+            first = messages[0]
+            messages[0] = {
+                **first,
+                "content": [
+                    {"text": f"Summary of the earlier conversation:\n{window.summary}"},
+                    *first["content"],
+                ],
+            }
+        return messages
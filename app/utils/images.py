@@ -0,0 +1,54 @@
+#
+# Image helpers for the InvokeModel vision requests
+#
+import json
+import base64
+from io import BytesIO
+
+#get a BytesIO object from file bytes
+def get_bytesio_from_bytes(image_bytes):
+    image_io = BytesIO(image_bytes)
+    return image_io
+
+#get a base64-encoded string from file bytes
+def get_base64_from_bytes(image_bytes):
+    resized_io = get_bytesio_from_bytes(image_bytes)
+    img_str = base64.b64encode(resized_io.getvalue()).decode("utf-8")
+    return img_str
+
+#load the bytes from a file on disk
+def get_bytes_from_file(file_path):
+    with open(file_path, "rb") as image_file:
+        file_bytes = image_file.read()
+    return file_bytes
+
+#get the stringified request body for the InvokeModel API call
+def get_request_body(prompt, image_bytes=None, mask_prompt=None, negative_prompt=None):
+    input_image_base64 = get_base64_from_bytes(image_bytes)
+    
+    body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 4000,
+        "temperature": 0,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "image/jpeg", #this doesn't seem to matter?
+                            "data": input_image_base64,
+                        },
+                    },
+                    {
+                        "type": "text",
+                        "text": prompt
+                    }
+                ],
+            }
+        ],
+    }
+    
+    return json.dumps(body)
@@ -0,0 +1,121 @@
+"""
+Cached, paginated listing of Bedrock knowledge bases shared by every Streamlit session
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from utils.clients import get_client
+
+logger = logging.getLogger(__name__)
+
+
+class KBCatalog:
+    """
+    Lists every knowledge base in the account (following nextToken) and caches the result.
+    After the TTL the cached list keeps being served while a background thread refreshes it,
+    so page renders only wait for the very first load.
+    """
+
+    def __init__(self, client, ttl_seconds: float = 300, page_size: int = 100):
+        """
+        Initialize the KBCatalog.
+
+        Args:
+            client: The Bedrock Agent client object.
+            ttl_seconds (float, optional): How long a listing is fresh. Defaults to 300.
+            page_size (int, optional): The maxResults of each list_knowledge_bases call. Defaults to 100.
+        """
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.page_size = page_size
+        self.last_error = None
+        self._kbs = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _fetch(self) -> dict[str, str]:
+        kbs = {}
+        kwargs = {"maxResults": self.page_size}
+        while True:
+            response = self.client.list_knowledge_bases(**kwargs)
+            for kb in response["knowledgeBaseSummaries"]:
+                kbs[kb["name"]] = kb["knowledgeBaseId"]
+            if not response.get("nextToken"):
+                return kbs
+            kwargs["nextToken"] = response["nextToken"]
+
+    def refresh(self) -> dict[str, str]:
+        """
+        Reload the listing now.
+
+        Returns:
+            dict[str, str]: Knowledge base IDs keyed by name.
+        """
+        with self._load_lock:
+            try:
+                kbs = self._fetch()
+                with self._lock:
+                    self._kbs = kbs
+                    self._loaded_at = time.time()
+                    self.last_error = None
+                return kbs
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            # Keep serving the previous listing; the next get() retries
+            self.last_error = e
+            logger.warning("Knowledge base listing refresh failed: %s", e)
+
+    def get(self) -> dict[str, str]:
+        """
+        Get the knowledge bases, loading them on first use and refreshing stale listings in the background.
+
+        Returns:
+            dict[str, str]: Knowledge base IDs keyed by name.
+        """
+        with self._lock:
+            kbs = self._kbs
+            stale = time.time() - self._loaded_at > self.ttl_seconds
+            start_refresh = kbs is not None and stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if kbs is None:
+            with self._load_lock:
+                if self._kbs is not None:
+                    return dict(self._kbs)
+            return dict(self.refresh())
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return dict(kbs)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_kb_catalog(region_name: Optional[str] = None) -> KBCatalog:
+    """
+    Get the process-wide KBCatalog for a region, shared by every Streamlit session.
+
+    Args:
+        region_name (str, optional): The AWS region. Defaults to None (the session's default region).
+
+    Returns:
+        KBCatalog: The catalog for the region.
+    """
+    with _catalogs_lock:
+        catalog = _catalogs.get(region_name)
+        if catalog is None:
+            catalog = KBCatalog(get_client("bedrock-agent", region_name=region_name))
+            _catalogs[region_name] = catalog
+        return catalog
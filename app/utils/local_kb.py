@@ -0,0 +1,282 @@
+"""
+Local FAISS-backed knowledge base that answers KBHandler queries in-process
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+import faiss
+import numpy as np
+
+from utils.bedrock import KBHandler
+from utils.bm25 import BM25Index
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.jsonl"
+CONFIG_FILE = "config.json"
+
+
+def chunk_text(text: str, max_tokens: int = 512, overlap_percentage: int = 20) -> list[str]:
+    """
+    Split text into fixed-size chunks with overlap, mirroring the FIXED_SIZE chunking strategy
+    used for the Bedrock knowledge base (tokens approximated as words).
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int, optional): The chunk size. Defaults to 512.
+        overlap_percentage (int, optional): The overlap between consecutive chunks. Defaults to 20.
+
+    Returns:
+        list[str]: The chunks.
+    """
+    words = text.split()
+    step = max(1, max_tokens - max_tokens * overlap_percentage // 100)
+    return [
+        " ".join(words[start:start + max_tokens])
+        for start in range(0, max(len(words) - max_tokens + step, 1), step)
+        if words[start:start + max_tokens]
+    ]
+
+
+def embed_many(embed: Callable[[str], list[float]], texts: list[str], max_concurrency: int = 8) -> np.ndarray:
+    """
+    Embed texts concurrently and return L2-normalized vectors, so inner product equals cosine similarity.
+
+    Args:
+        embed (callable): Maps a string to its embedding vector, e.g. `bedrock_embedder(client)`.
+        texts (list[str]): The texts to embed.
+        max_concurrency (int, optional): The maximum number of parallel embedding calls. Defaults to 8.
+
+    Returns:
+        np.ndarray: A (len(texts), dimension) float32 array.
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        vectors = np.asarray(list(executor.map(embed, texts)), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class LocalVectorIndex:
+    """
+    An HNSW index of text chunks persisted to a directory, with chunk metadata in a JSON lines sidecar.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        m: int = 32,
+        ef_search: int = 64,
+        embedding_model: Optional[str] = None,
+        index=None,
+        chunks: Optional[list] = None,
+    ):
+        """
+        Initialize the LocalVectorIndex.
+
+        Args:
+            dimension (int): The embedding dimension.
+            m (int, optional): The HNSW graph degree. Defaults to 32.
+            ef_search (int, optional): The HNSW search breadth. Defaults to 64.
+            embedding_model (str, optional): The ID of the model the vectors were built with. Defaults to None.
+            index (faiss.Index, optional): An existing index, e.g. one loaded from disk. Defaults to None.
+            chunks (list, optional): The chunk metadata for an existing index. Defaults to None.
+        """
+        self.dimension = dimension
+        self.m = m
+        self.embedding_model = embedding_model
+        self.index = index if index is not None else faiss.IndexHNSWFlat(dimension, m, faiss.METRIC_INNER_PRODUCT)
+        faiss.ParameterSpace().set_index_parameter(self.index, "efSearch", ef_search)
+        self.ef_search = ef_search
+        self.chunks = chunks or []
+        self._saved = len(self.chunks)
+        self._saved_path = None
+        self._lexical = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def add(self, texts: list[str], vectors: np.ndarray, sources: list[str]) -> None:
+        """
+        Add chunks to the index. Vectors must already be L2-normalized.
+
+        Args:
+            texts (list[str]): The chunk texts.
+            vectors (np.ndarray): The chunk embeddings, one row per text.
+            sources (list[str]): The source URI of each chunk.
+        """
+        with self._lock:
+            self.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+            self.chunks.extend({"text": text, "source": source} for text, source in zip(texts, sources))
+            if self._lexical is not None:
+                self._lexical.add(texts, sources)
+
+    def add_documents(
+        self,
+        documents: dict[str, str],
+        embed: Callable[[str], list[float]],
+        max_tokens: int = 512,
+        overlap_percentage: int = 20,
+    ) -> int:
+        """
+        Chunk, embed and add documents that are not already indexed.
+
+        Args:
+            documents (dict[str, str]): Document text keyed by source URI.
+            embed (callable): Maps a string to its embedding vector.
+            max_tokens (int, optional): The chunk size. Defaults to 512.
+            overlap_percentage (int, optional): The chunk overlap. Defaults to 20.
+
+        Returns:
+            int: The number of chunks added.
+        """
+        with self._lock:
+            indexed = {chunk["source"] for chunk in self.chunks}
+        texts, sources = [], []
+        for source, text in documents.items():
+            if source in indexed:
+                continue
+            for chunk in chunk_text(text, max_tokens, overlap_percentage):
+                texts.append(chunk)
+                sources.append(source)
+        if texts:
+            self.add(texts, embed_many(embed, texts), sources)
+        return len(texts)
+
+    def bm25_index(self) -> BM25Index:
+        """
+        Build a BM25 index over this index's chunks. It is kept up to date as chunks are added.
+
+        Returns:
+            BM25Index: The keyword index.
+        """
+        with self._lock:
+            if self._lexical is None:
+                self._lexical = BM25Index()
+                self._lexical.add([c["text"] for c in self.chunks], [c["source"] for c in self.chunks])
+            return self._lexical
+
+    def search(self, vector, k: int) -> list[tuple[dict, float]]:
+        """
+        Find the chunks most similar to a query vector.
+
+        Args:
+            vector: The query embedding.
+            k (int): The number of results.
+
+        Returns:
+            list[tuple[dict, float]]: Chunk metadata and cosine similarity, best first.
+        """
+        query = np.asarray([vector], dtype=np.float32)
+        faiss.normalize_L2(query)
+        with self._lock:
+            scores, ids = self.index.search(query, min(k, len(self.chunks)) or 1)
+            return [(self.chunks[i], float(s)) for s, i in zip(scores[0], ids[0]) if i >= 0]
+
+    def save(self, path: str) -> None:
+        """
+        Write the index to a directory. Chunk metadata is appended, so saving after incremental
+        adds only writes the new chunks.
+
+        Args:
+            path (str): The directory to write to.
+        """
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            faiss.write_index(self.index, str(directory / INDEX_FILE))
+            appending = self._saved and self._saved_path == directory.absolute() and (directory / CHUNKS_FILE).exists()
+            mode = "a" if appending else "w"
+            start = self._saved if mode == "a" else 0
+            with open(directory / CHUNKS_FILE, mode, encoding="utf-8") as f:
+                for chunk in self.chunks[start:]:
+                    f.write(json.dumps(chunk) + "\n")
+            self._saved = len(self.chunks)
+            self._saved_path = directory.absolute()
+            (directory / CONFIG_FILE).write_text(
+                json.dumps(
+                    {
+                        "dimension": self.dimension,
+                        "m": self.m,
+                        "ef_search": self.ef_search,
+                        "embedding_model": self.embedding_model,
+                    }
+                )
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalVectorIndex":
+        """
+        Load an index from a directory. The HNSW graph and vectors are read into memory.
+
+        Args:
+            path (str): The directory written by `save`.
+
+        Returns:
+            LocalVectorIndex: The loaded index.
+        """
+        directory = Path(path)
+        config = json.loads((directory / CONFIG_FILE).read_text())
+        index = faiss.read_index(str(directory / INDEX_FILE))
+        with open(directory / CHUNKS_FILE, encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        loaded = cls(
+            config["dimension"],
+            config["m"],
+            config["ef_search"],
+            embedding_model=config.get("embedding_model"),
+            index=index,
+            chunks=chunks,
+        )
+        loaded._saved_path = directory.absolute()
+        return loaded
+
+
+class LocalKBHandler(KBHandler):
+    """
+    A KBHandler that answers queries from a LocalVectorIndex instead of the Bedrock Knowledge Base,
+    returning results in the same `retrievalResults` shape.
+    """
+
+    # The local index has no ingestion jobs; it changes only when the page reloads it
+    checks_ingestion = False
+
+    def __init__(
+        self,
+        index: LocalVectorIndex,
+        embed: Callable[[str], list[float]],
+        kb_params: dict,
+        kb_id: str = "local",
+        cache=None,
+        lexical_index=None,
+    ):
+        """
+        Initialize the LocalKBHandler.
+
+        Args:
+            index (LocalVectorIndex): The index to search.
+            embed (callable): Maps a query to its embedding vector; must match the model used to build the index.
+            kb_params (dict): The retrieval configuration; vectorSearchConfiguration.numberOfResults sets k.
+            kb_id (str, optional): The name used for this knowledge base (e.g. in cache namespaces). Defaults to "local".
+            cache (RetrievalCache, optional): A cache for retrieval results. Defaults to None.
+            lexical_index (BM25Index, optional): A BM25 index for hybrid retrieval, e.g. from `bm25_index()`.
+                                                 Defaults to None.
+        """
+        super().__init__(client=None, kb_params=kb_params, kb_id=kb_id, cache=cache, lexical_index=lexical_index)
+        self.index = index
+        self.embed = embed
+
+    def _retrieve(self, prompt: str, params: Optional[dict] = None) -> list[dict]:
+        k = (params or self.params).get("vectorSearchConfiguration", {}).get("numberOfResults", 5)
+        return [
+            {
+                "content": {"text": chunk["text"]},
+                "location": {"type": "LOCAL", "localLocation": {"uri": chunk["source"]}},
+                "score": score,
+                "metadata": {"x-amz-bedrock-kb-source-uri": chunk["source"]},
+            }
+            for chunk, score in self.index.search(self.embed(prompt), k)
+        ]
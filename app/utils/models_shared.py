@@ -3,6 +3,8 @@
 #
 from langchain_community.llms import Bedrock
 from langchain_aws import ChatBedrock
+from utils.clients import get_client
+from utils.rate_control import get_rate_controlled_client
 
 vision_model_options_dict = {
     "us.anthropic.claude-3-5-sonnet-20240620-v1:0": "Claude 3.5 Sonnet",
@@ -42,20 +44,24 @@ model_options_dict = {
 def get_model_label(model_id):
     return model_options_dict[model_id]
 
-def get_llm(model_id, temperature):
+def get_llm(model_id, temperature, rate_controlled=False): #rate_controlled sends every model call through the model's RateController
     
+    #shared Bedrock client; under a RateController only the controller retries throttled calls
+    client = get_rate_controlled_client() if rate_controlled else get_client('bedrock-runtime')
     model_kwargs = get_inference_parameters(model_id, temperature)
     
     bedrock_model_provider = model_id.split('.')[0] #grab the model provider from the first part of the model id
     
     if bedrock_model_provider == 'anthropic' or bedrock_model_provider == 'mistral' or bedrock_model_provider == 'meta' or bedrock_model_provider == 'amazon':
         llm = ChatBedrock(
+            client=client,
             model_id=model_id, #set the foundation model
             model_kwargs=model_kwargs) #configure the properties for the LLM
         
         is_chat = True
     else:
         llm = Bedrock(
+            client=client,
             model_id=model_id, #set the foundation model
             model_kwargs=model_kwargs) #configure the properties for the LLM
         
@@ -0,0 +1,156 @@
+"""
+Query expansion and reciprocal rank fusion for multi-query retrieval
+"""
+
+import hashlib
+import re
+from typing import Callable, Optional
+
+from utils.retrieval_cache import normalize_query
+
+STOPWORDS = set(
+    "a an and are as at be by can could do does for from has have how i in is it its me my of on or "
+    "our should so than that the their them there these this those to was we what when where which "
+    "who why will with would you your".split()
+)
+
+# Tokens that look like SKUs, part numbers or model names: letters mixed with digits ("RTX4090", "AB-1200/X")
+# or hyphenated upper-case codes ("ABC-XL"). Plain acronyms ("AWS") and numbers ("2023") are not identifiers.
+IDENTIFIER_PATTERN = re.compile(r"\b(?=[\w\-./]*[A-Za-z])(?=[\w\-./]*\d)\w+(?:[\-./]\w+)*\b|\b[A-Z]+\d*(?:-[A-Z0-9]+)+\b")
+
+
+def expand_query(question: str, max_queries: int = 4) -> list[str]:
+    """
+    Expand a question into sub-queries with simple rules: the original question, each clause of a
+    compound question, a keyword-only query and a query of exact identifiers.
+
+    Args:
+        question (str): The user's question.
+        max_queries (int, optional): The maximum number of queries to return. Defaults to 4.
+
+    Returns:
+        list[str]: Unique queries, the original question first.
+    """
+    queries = [question.strip()]
+
+    clauses = [c.strip() for c in re.split(r"\?|;|\band also\b|\band\b(?=\s+(?:how|what|which|when|where|why|does|is|can)\b)", question) if c]
+    if len(clauses) > 1:
+        queries.extend(c for c in clauses if len(c.split()) > 2)
+
+    keywords = [w for w in normalize_query(question).split() if w not in STOPWORDS]
+    if keywords:
+        queries.append(" ".join(keywords))
+
+    identifiers = IDENTIFIER_PATTERN.findall(question)
+    if identifiers:
+        queries.append(" ".join(identifiers))
+
+    unique = []
+    seen = set()
+    for query in queries:
+        key = normalize_query(query)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(query)
+    return unique[:max_queries]
+
+
+def llm_query_expander(handler, count: int = 3) -> Callable[[str], list[str]]:
+    """
+    Build a query expander that asks a Bedrock model for alternative phrasings of a question.
+
+    Args:
+        handler (BedrockHandler): The handler used to call the model.
+        count (int, optional): The number of phrasings to ask for. Defaults to 3.
+
+    Returns:
+        callable: A function that maps a question to a list of alternative queries.
+    """
+
+    def expand(question: str) -> list[str]:
+        prompt = (
+            f"Write {count} different search queries that would find documents answering the question below. "
+            f"Return one query per line with no numbering or extra text.\n\nQuestion: {question}"
+        )
+        response = handler.invoke_model([{"role": "user", "content": [{"text": prompt}]}])
+        text = response["output"]["message"]["content"][0]["text"]
+        return [line.strip(" -*\t") for line in text.splitlines() if line.strip()][:count]
+
+    return expand
+
+
+def llm_follow_up_suggester(handler, count: int = 3) -> Callable[[str, str], list[str]]:
+    """
+    Build a function that asks a Bedrock model for likely follow-up questions to an answer.
+
+    Args:
+        handler (BedrockHandler): The handler used to call the model.
+        count (int, optional): The number of follow-ups to ask for. Defaults to 3.
+
+    Returns:
+        callable: A function that maps a question and its answer to a list of follow-up questions.
+    """
+
+    def suggest(question: str, answer: str) -> list[str]:
+        prompt = (
+            f"Write {count} short follow-up questions a customer might ask next. "
+            f"Return one question per line with no numbering or extra text.\n\n"
+            f"Question: {question}\n\nAnswer: {answer}"
+        )
+        response = handler.invoke_model([{"role": "user", "content": [{"text": prompt}]}])
+        text = response["output"]["message"]["content"][0]["text"]
+        return [line.strip(" -*\t") for line in text.splitlines() if line.strip()][:count]
+
+    return suggest
+
+
+def result_key(result: dict) -> tuple:
+    """
+    Identify a retrieved chunk by its source location and a hash of its normalized text,
+    so the same chunk returned by several queries is only kept once.
+
+    Args:
+        result (dict): A retrieval result with "content" and "location".
+
+    Returns:
+        tuple: The dedup key.
+    """
+    location = result.get("location", {})
+    source = (
+        location.get("s3Location", {}).get("uri")
+        or location.get("webLocation", {}).get("url")
+        or location.get("localLocation", {}).get("uri")
+        or location.get("type")
+    )
+    digest = hashlib.sha1(normalize_query(result["content"]["text"]).encode("utf-8")).hexdigest()
+    return source, digest
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60, limit: Optional[int] = None) -> list[dict]:
+    """
+    Fuse several ranked result lists with reciprocal rank fusion (score = sum of 1 / (k + rank)).
+
+    Args:
+        rankings (list[list[dict]]): Retrieval results for each query, best first.
+        k (int, optional): The RRF damping constant. Defaults to 60.
+        limit (int, optional): The maximum number of results to return. Defaults to None (all).
+
+    Returns:
+        list[dict]: Deduplicated results ordered by fused score. Each is a copy of the best-scoring
+                    original with an added "fusedScore".
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            key = result_key(result)
+            entry = fused.get(key)
+            if entry is None:
+                fused[key] = entry = {"score": 0.0, "result": result}
+            elif result.get("score", 0) > entry["result"].get("score", 0):
+                entry["result"] = result
+            entry["score"] += 1 / (k + rank)
+
+    ordered = sorted(fused.values(), key=lambda e: e["score"], reverse=True)
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [{**entry["result"], "fusedScore": entry["score"]} for entry in ordered]
@@ -0,0 +1,278 @@
+#
+# PDF text extraction shared across Streamlit apps
+#
+import hashlib
+import io
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+import PyPDF2
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent.parent / "data" / "pdf_text_cache.db"
+
+# PDFs with fewer pages than this are parsed in-process; the pool only pays off for longer files
+PARALLEL_MIN_PAGES = 16
+POOL_WORKERS = os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the Streamlit server process is multi-threaded
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drop a broken pool so that the next parallel extraction starts a new one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _read_pdf_bytes(pdf_file) -> bytes:
+    if isinstance(pdf_file, (str, Path)):
+        return Path(pdf_file).read_bytes()
+    if hasattr(pdf_file, "getvalue"):
+        return pdf_file.getvalue()
+    return pdf_file.read()
+
+
+def _extract_page_range(source, start: int, stop: int) -> list[str]:
+    """
+    Extract the text of pages [start, stop) from PDF bytes or a file path. Workers are given a path
+    so that the file isn't pickled to every one of them.
+    """
+    pdf_reader = PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_file, parallel: bool = True) -> Iterator[tuple[int, str]]:
+    """
+    Extract the text of each page of a PDF. Long PDFs are split into one shard of pages per worker,
+    parsed in a shared process pool (PDF parsing is pure Python, so threads would contend for the GIL).
+    Pages are yielded in page order as soon as they and every page before them are done. If a worker
+    dies, the pool is replaced and the remaining pages are extracted in-process.
+
+    Args:
+        pdf_file: A path, or a file-like object such as a Streamlit UploadedFile.
+        parallel (bool, optional): Use the process pool for long PDFs. Defaults to True.
+
+    Yields:
+        tuple[int, str]: The zero-based page number and its text.
+    """
+    data = _read_pdf_bytes(pdf_file)
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    if not parallel or page_count < PARALLEL_MIN_PAGES or POOL_WORKERS < 2:
+        for i, text in enumerate(_extract_page_range(data, 0, page_count)):
+            yield i, text
+        return
+
+    temporary = None
+    if isinstance(pdf_file, (str, Path)):
+        path = str(pdf_file)
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temporary:
+            temporary.write(data)
+        path = temporary.name
+
+    pool = _get_pool()
+    shard_size = -(-page_count // POOL_WORKERS)
+    shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+    futures = {}
+    finished = {}
+    next_shard = 0
+    next_page = 0
+    try:
+        try:
+            for start, stop in shards:
+                futures[pool.submit(_extract_page_range, path, start, stop)] = start
+            for future in as_completed(futures):
+                finished[futures[future]] = future.result()
+                # Release every shard that is now contiguous with what has been yielded
+                while next_shard < len(shards) and shards[next_shard][0] in finished:
+                    start, next_page = shards[next_shard]
+                    for offset, text in enumerate(finished.pop(start)):
+                        yield start + offset, text
+                    next_shard += 1
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            for offset, text in enumerate(_extract_page_range(data, next_page, page_count)):
+                yield next_page + offset, text
+    finally:
+        for future in futures:
+            future.cancel()
+        if temporary is not None:
+            os.unlink(temporary.name)
+
+
+# Function to extract text from PDF
+def extract_text_from_pdf(pdf_file):
+    # Join once at the end; repeated += copies the text so far for every page
+    return "".join(text + "\n" for _, text in iter_pdf_pages(pdf_file))
+
+
+class PDFTextCache:
+    """
+    Extracted PDF text keyed by the SHA-256 of the file content, held in a size-bounded in-memory LRU
+    backed by an optional size-bounded SQLite file.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        db_path: Optional[str] = None,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ):
+        """
+        Initialize the PDFTextCache.
+
+        Args:
+            max_memory_bytes (int, optional): The maximum text kept in memory, in bytes. Defaults to 64 MB.
+            db_path (str, optional): The path of the SQLite file for the on-disk tier. Defaults to None (memory only).
+            max_disk_bytes (int, optional): The maximum text kept on disk, in bytes. Defaults to 512 MB.
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.db_path = db_path
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS pdf_text ("
+                    "digest TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS pdf_text_accessed ON pdf_text (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, digest: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        if digest in self._memory:
+            self._memory_bytes -= self._memory.pop(digest)[1]
+        self._memory[digest] = (text, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            self._memory_bytes -= self._memory.popitem(last=False)[1][1]
+
+    def _store(self, digest: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pdf_text (digest, text, size, accessed) VALUES (?, ?, ?, ?)",
+                (digest, text, size, time.time()),
+            )
+            # Evict least recently used files until the total fits
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_text").fetchone()[0]
+            for old_digest, old_size in conn.execute("SELECT digest, size FROM pdf_text ORDER BY accessed").fetchall():
+                if total <= self.max_disk_bytes:
+                    break
+                conn.execute("DELETE FROM pdf_text WHERE digest = ?", (old_digest,))
+                total -= old_size
+
+    def get_or_extract(self, data: bytes) -> str:
+        """
+        Return the text of a PDF, extracting it only if this content has not been seen before.
+
+        Args:
+            data (bytes): The PDF file content.
+
+        Returns:
+            str: The extracted text.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            entry = self._memory.get(digest)
+            if entry is not None:
+                self._memory.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute("SELECT text FROM pdf_text WHERE digest = ?", (digest,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE pdf_text SET accessed = ? WHERE digest = ?", (time.time(), digest))
+            if row is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(digest, row[0])
+                return row[0]
+
+        text = extract_text_from_pdf(io.BytesIO(data))
+        with self._lock:
+            self.misses += 1
+            self._remember(digest, text)
+        if self.db_path:
+            self._store(digest, text)
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_bytes": self._memory_bytes,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_text_cache() -> PDFTextCache:
+    """
+    Get the process-wide PDFTextCache, shared by every Streamlit session. Its on-disk tier is
+    $PDF_CACHE_PATH or data/pdf_text_cache.db.
+
+    Returns:
+        PDFTextCache: The cache.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PDFTextCache(db_path=os.environ.get("PDF_CACHE_PATH") or str(DEFAULT_CACHE_PATH))
+        return _cache
+
+
+# Function to extract text from an uploaded PDF, reusing earlier extractions of the same content
+def extract_text_cached(pdf_file) -> str:
+    return get_pdf_text_cache().get_or_extract(_read_pdf_bytes(pdf_file))
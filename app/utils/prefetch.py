@@ -0,0 +1,111 @@
+"""
+Background retrieval that starts before the chain needs it, with a short-lived result cache
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+
+class RetrievalPrefetcher:
+    """
+    Runs retrievals on a background pool as soon as a question is known (or guessed), so that by the
+    time the chain asks for the documents they are already on their way. Results are kept briefly
+    and shared between sessions.
+    """
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 256, max_workers: int = 8):
+        """
+        Initialize the RetrievalPrefetcher.
+
+        Args:
+            ttl_seconds (float, optional): How long a prefetched result can be used. Defaults to 60.
+            max_entries (int, optional): The maximum number of results kept. Defaults to 256.
+            max_workers (int, optional): The number of background retrieval threads. Defaults to 8.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._futures = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval-prefetch")
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Hashable):
+        entry = self._futures.get(key)
+        if entry is None:
+            return None
+        future, created = entry
+        if time.time() - created > self.ttl_seconds or (future.done() and future.exception() is not None):
+            del self._futures[key]
+            return None
+        return future
+
+    def prefetch(self, key: Hashable, retrieve: Callable[[], object]) -> Future:
+        """
+        Start a retrieval in the background unless one for the same key is already cached or running.
+
+        Args:
+            key (Hashable): Identifies the retrieval, e.g. the knowledge base, mode and normalized question.
+            retrieve (callable): Performs the retrieval.
+
+        Returns:
+            Future: The pending or finished result.
+        """
+        with self._lock:
+            future = self._lookup(key)
+            if future is None:
+                future = self._executor.submit(retrieve)
+                self._futures[key] = (future, time.time())
+                while len(self._futures) > self.max_entries:
+                    self._futures.popitem(last=False)
+            return future
+
+    def get(self, key: Hashable, retrieve: Callable[[], object]):
+        """
+        Get a retrieval result, waiting for a prefetch in flight or running `retrieve` now if there is none.
+        A failed prefetch is retried in the calling thread.
+
+        Args:
+            key (Hashable): Identifies the retrieval.
+            retrieve (callable): Performs the retrieval.
+
+        Returns:
+            The retrieval result.
+        """
+        with self._lock:
+            future = self._lookup(key)
+            if future is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass
+        return retrieve()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._futures)}
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_retrieval_prefetcher() -> RetrievalPrefetcher:
+    """
+    Get the process-wide RetrievalPrefetcher, shared by every Streamlit session.
+
+    Returns:
+        RetrievalPrefetcher: The prefetcher.
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = RetrievalPrefetcher()
+        return _prefetcher
@@ -0,0 +1,290 @@
+"""
+Builds the chat page's RAG chain and memoizes compiled chains across Streamlit sessions
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Callable, Optional
+
+from langchain_aws import ChatBedrock
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import ConfigurableFieldSpec, RunnableConfig, RunnableLambda, RunnableParallel
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from utils.bedrock import KBHandler
+from utils.context_packer import pack_context
+from utils.history import ConversationHistory, get_history_budget
+from utils.prefetch import get_retrieval_prefetcher
+from utils.rate_control import get_rate_controlled_client
+from utils.retrieval_cache import normalize_query
+
+RETRIEVAL_MODES = ("Standard", "Multi-query", "Reranked", "Hybrid", "Adaptive")
+CONTEXT_TOKEN_BUDGET = 2000
+RERANK_FETCH_K = 15
+
+
+@dataclass(frozen=True)
+class ChainSettings:
+    """
+    Everything a compiled chain depends on. Chains are shared between sessions with equal settings.
+    """
+
+    model_id: str
+    kb_id: str
+    temperature: float
+    top_p: float
+    top_k: int
+    max_tokens: int
+    system_prompt: str
+    retrieval_mode: str = "Standard"
+    region_name: str = "us-east-1"
+
+
+def _reports(config: RunnableConfig) -> dict:
+    """
+    The per-session dict that retrieval and history trimming write their reports to,
+    passed as the "reports" configurable. Chains are shared, so reports can't live on them.
+    """
+    return config.get("configurable", {}).get("reports", {})
+
+
+def retrieve_documents(kb_handler: KBHandler, mode: str, question: str) -> tuple[list[Document], dict]:
+    """
+    Retrieve KB chunks for the question with the given retrieval mode and pack them into the
+    context budget.
+
+    Args:
+        kb_handler (KBHandler): The knowledge base to search.
+        mode (str): One of RETRIEVAL_MODES.
+        question (str): The user's question.
+
+    Returns:
+        tuple[list[Document], dict]: The chunks as LangChain documents, and reports with the PackedContext
+                                     ("packed") and, in Adaptive mode, the AdaptiveSelection ("adaptive").
+    """
+    reports = {}
+    if mode == "Multi-query":
+        docs = kb_handler.get_relevant_docs_multi(question)
+    elif mode == "Reranked":
+        # Over-fetch and keep the best chunks by local lexical + embedding score
+        docs = kb_handler.get_relevant_docs_reranked(question, fetch_k=RERANK_FETCH_K)
+    elif mode == "Hybrid":
+        # BM25 + vector; uses the KB's own hybrid search when there is no local keyword index
+        docs = kb_handler.get_relevant_docs_hybrid(question)
+    elif mode == "Adaptive":
+        # Keep as many chunks as the score distribution supports
+        reports["adaptive"] = kb_handler.get_relevant_docs_adaptive(question)
+        docs = reports["adaptive"].docs
+    else:
+        docs = kb_handler.get_relevant_docs(question)
+    # Drop duplicate/overlapping chunks and fit the context budget
+    reports["packed"] = pack_context(docs, CONTEXT_TOKEN_BUDGET)
+    documents = [
+        Document(
+            page_content=doc["content"]["text"],
+            metadata={
+                "location": doc["location"],
+                "source_metadata": doc.get("metadata", {}),
+                "score": doc.get("score", 0),
+            },
+        )
+        for doc in reports["packed"].docs
+    ]
+    return documents, reports
+
+
+def _retrieval_key(settings: ChainSettings, question: str) -> tuple:
+    return settings.region_name, settings.kb_id, settings.retrieval_mode, normalize_query(question)
+
+
+def build_rag_chain(settings: ChainSettings, kb_handler: KBHandler) -> RunnableWithMessageHistory:
+    """
+    Assemble the RAG chain: retrieval, history trimming, prompt and model, wrapped with message history.
+
+    The chain holds no session state. Pass the session's message history as the "message_history"
+    configurable and a dict for retrieval and history reports as "reports".
+
+    Args:
+        settings (ChainSettings): The model and retrieval settings.
+        kb_handler (KBHandler): The knowledge base to retrieve from.
+
+    Returns:
+        RunnableWithMessageHistory: The chain. Its output has "response" and "context".
+    """
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "You are a friendly, professional chatbot."
+             "Answer the question based only on the following context:\n {context}"),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "{question}"),
+        ]
+    )
+
+    model = ChatBedrock(
+        # Streams through the model's shared rate controller, like every other Bedrock call
+        client=get_rate_controlled_client(region_name=settings.region_name),
+        model_id=settings.model_id,
+        model_kwargs={
+            "temperature": settings.temperature,
+            "top_p": settings.top_p,
+            "top_k": settings.top_k,
+            "max_tokens": settings.max_tokens,
+            "stop_sequences": ["\n\nHuman"],
+            "system": settings.system_prompt,
+        },
+    )
+
+    # Uses a prefetched result when `prefetch_retrieval` already started this question
+    def retrieve(question: str, config: RunnableConfig) -> list[Document]:
+        documents, reports = get_retrieval_prefetcher().get(
+            _retrieval_key(settings, question),
+            lambda: retrieve_documents(kb_handler, settings.retrieval_mode, question),
+        )
+        _reports(config).update(reports)
+        return documents
+
+    # Keep the history sent to the model inside the model's token budget. The session's history keeps
+    # a ConversationHistory that counts each message once; other histories are counted per turn.
+    def trim_history(messages: list, config: RunnableConfig) -> list:
+        conversation = getattr(config.get("configurable", {}).get("message_history"), "conversation", None)
+        if conversation is None:
+            conversation = ConversationHistory(max_tokens=0)
+            conversation.extend(messages)
+        conversation.max_tokens = get_history_budget(settings.model_id)
+        window = _reports(config)["history"] = conversation.window()
+        return window.messages
+
+    chain = (
+        RunnableParallel({
+            "context": itemgetter("question") | RunnableLambda(retrieve),
+            "question": itemgetter("question"),
+            "history": itemgetter("history") | RunnableLambda(trim_history),
+        })
+        .assign(response=prompt | model | StrOutputParser())
+        .pick(["response", "context"])
+    )
+
+    return RunnableWithMessageHistory(
+        chain,
+        lambda message_history: message_history,
+        input_messages_key="question",
+        history_messages_key="history",
+        output_messages_key="response",
+        history_factory_config=[
+            ConfigurableFieldSpec(
+                id="message_history",
+                annotation=BaseChatMessageHistory,
+                name="Message history",
+                description="The session's chat message history.",
+                is_shared=True,
+            )
+        ],
+    )
+
+
+class ChainCache:
+    """
+    A thread-safe LRU cache of compiled chains keyed by ChainSettings.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        """
+        Initialize the ChainCache.
+
+        Args:
+            max_entries (int, optional): The maximum number of chains kept. Defaults to 16.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._chains = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, settings: ChainSettings, make_kb_handler: Callable[[], KBHandler]) -> RunnableWithMessageHistory:
+        """
+        Get the chain for some settings, building it on a miss.
+
+        Args:
+            settings (ChainSettings): The model and retrieval settings.
+            make_kb_handler (callable): Creates the KBHandler for `settings`; only called on a miss, and must
+                                        depend on nothing but `settings`.
+
+        Returns:
+            RunnableWithMessageHistory: The chain.
+        """
+        with self._lock:
+            entry = self._chains.get(settings)
+            if entry is not None:
+                self._chains.move_to_end(settings)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        kb_handler = make_kb_handler()
+        chain = build_rag_chain(settings, kb_handler)
+        with self._lock:
+            # Another session may have built the same chain meanwhile; keep the first
+            entry = self._chains.setdefault(settings, (chain, kb_handler))
+            self._chains.move_to_end(settings)
+            while len(self._chains) > self.max_entries:
+                self._chains.popitem(last=False)
+        return entry[0]
+
+    def kb_handler(self, settings: ChainSettings) -> Optional[KBHandler]:
+        """
+        The KBHandler of the cached chain for some settings, or None if no chain is cached.
+        """
+        with self._lock:
+            entry = self._chains.get(settings)
+            return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chains.clear()
+
+
+_chain_cache = ChainCache()
+
+
+def get_rag_chain(
+    settings: ChainSettings, make_kb_handler: Callable[[], KBHandler], cache: Optional[ChainCache] = None
+) -> RunnableWithMessageHistory:
+    """
+    Get the process-wide memoized RAG chain for some settings, shared by every Streamlit session.
+
+    Args:
+        settings (ChainSettings): The model and retrieval settings.
+        make_kb_handler (callable): Creates the KBHandler for `settings` on a miss.
+        cache (ChainCache, optional): The cache to use. Defaults to the process-wide cache.
+
+    Returns:
+        RunnableWithMessageHistory: The chain.
+    """
+    return (cache or _chain_cache).get(settings, make_kb_handler)
+
+
+def prefetch_retrieval(settings: ChainSettings, questions: list[str], cache: Optional[ChainCache] = None) -> None:
+    """
+    Start retrieval for questions in the background so the chain finds the documents ready:
+    the question just submitted (overlapping retrieval with history loading and prompt assembly)
+    or likely follow-ups. Does nothing if no chain has been built for the settings yet.
+
+    Args:
+        settings (ChainSettings): The settings of the chain that will answer.
+        questions (list[str]): The questions to retrieve for.
+        cache (ChainCache, optional): The chain cache. Defaults to the process-wide cache.
+    """
+    kb_handler = (cache or _chain_cache).kb_handler(settings)
+    if kb_handler is None:
+        return
+    prefetcher = get_retrieval_prefetcher()
+    for question in questions:
+        prefetcher.prefetch(
+            _retrieval_key(settings, question),
+            lambda question=question: retrieve_documents(kb_handler, settings.retrieval_mode, question),
+        )
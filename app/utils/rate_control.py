@@ -0,0 +1,381 @@
+"""
+Process-wide rate control for Bedrock calls: token buckets, AIMD concurrency and jittered retries
+"""
+
+import json
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from botocore.exceptions import ClientError
+
+from utils.clients import RATE_CONTROLLED_CLIENT_CONFIG, get_client
+from utils.history import estimate_text_tokens, estimate_tokens
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+# On-demand quotas by model family (requests per minute, tokens per minute).
+# Set these to the values in the account's Service Quotas console.
+MODEL_QUOTAS = {
+    "anthropic.claude-3-5-sonnet": (50, 400_000),
+    "anthropic.claude-3-sonnet": (500, 1_000_000),
+    "anthropic.claude-3-haiku": (1000, 2_000_000),
+    "anthropic.claude-3-opus": (50, 400_000),
+    "amazon.titan-text": (400, 300_000),
+    "meta.llama3": (400, 300_000),
+}
+DEFAULT_QUOTA = (100, 200_000)
+
+
+class RateLimitTimeout(Exception):
+    """
+    Thrown when a call cannot be admitted or retried before its deadline
+    """
+
+    pass
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Check whether an exception is a Bedrock throttling or capacity error.
+
+    Args:
+        error (Exception): The exception raised by a boto3 call.
+
+    Returns:
+        bool: True if the call should be retried after backing off.
+    """
+    return (
+        isinstance(error, ClientError)
+        and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    )
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that refills continuously at a fixed rate.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        """
+        Initialize the TokenBucket full.
+
+        Args:
+            rate_per_second (float): How many tokens are added per second.
+            capacity (float): The maximum number of tokens the bucket holds.
+        """
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float = 1, deadline: Optional[float] = None) -> None:
+        """
+        Take tokens from the bucket, waiting for a refill if needed.
+
+        Args:
+            amount (float, optional): The number of tokens to take. Capped at the capacity. Defaults to 1.
+            deadline (float, optional): A `time.monotonic` timestamp after which to give up. Defaults to None.
+
+        Raises:
+            RateLimitTimeout: If the tokens would not be available before the deadline.
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate_per_second
+            if deadline is not None and now + wait > deadline:
+                raise RateLimitTimeout("Rate limit would be exceeded before the deadline")
+            time.sleep(wait)
+
+    def drain(self) -> None:
+        """
+        Empty the bucket, e.g. after the service reported throttling.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = 0
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps in-flight calls with a limit adjusted by additive-increase / multiplicative-decrease (AIMD).
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Initialize the AdaptiveConcurrencyLimiter.
+
+        Args:
+            initial_limit (float, optional): The starting concurrency limit. Defaults to 8.
+            min_limit (float, optional): The lowest the limit can drop to. Defaults to 1.
+            max_limit (float, optional): The highest the limit can grow to. Defaults to 64.
+            decrease_factor (float, optional): The multiplier applied on throttling. Defaults to 0.5.
+        """
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline: Optional[float] = None) -> None:
+        """
+        Wait for a free slot.
+
+        Args:
+            deadline (float, optional): A `time.monotonic` timestamp after which to give up. Defaults to None.
+
+        Raises:
+            RateLimitTimeout: If no slot frees up before the deadline.
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise RateLimitTimeout("No concurrency slot available before the deadline")
+                self._condition.wait(timeout)
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        """
+        Free a slot and adjust the limit based on how the call went.
+
+        Args:
+            throttled (bool, optional): Whether the call was throttled. Defaults to False.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            else:
+                # Grows by about one slot per `limit` successful calls
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class RateController:
+    """
+    Admits Bedrock calls through a request bucket, a token bucket and an adaptive concurrency limit,
+    and retries throttled calls with full-jitter exponential backoff until a deadline.
+
+    The controller is the only retry layer for the calls it runs; create their clients with
+    `RATE_CONTROLLED_CLIENT_CONFIG` so botocore does not retry them as well.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_attempts: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        timeout: float = 60.0,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    ):
+        """
+        Initialize the RateController.
+
+        Args:
+            requests_per_minute (float): The request quota for the model.
+            tokens_per_minute (float): The token quota for the model.
+            max_attempts (int, optional): The maximum number of attempts per call. Defaults to 6.
+            base_delay (float, optional): The first backoff ceiling in seconds. Defaults to 0.5.
+            max_delay (float, optional): The largest backoff ceiling in seconds. Defaults to 20.
+            timeout (float, optional): The default deadline for a call, in seconds. Defaults to 60.
+            limiter (AdaptiveConcurrencyLimiter, optional): The concurrency limiter. Defaults to a new one.
+        """
+        self.requests = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute / 6))
+        self.tokens = TokenBucket(tokens_per_minute / 60, max(1, tokens_per_minute / 6))
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.throttled = 0
+        self.retries = 0
+
+    def call(self, fn: Callable, *args, tokens: int = 0, timeout: Optional[float] = None, **kwargs):
+        """
+        Run a Bedrock call under rate control.
+
+        Args:
+            fn (callable): The function to call, e.g. `client.converse`.
+            *args: Positional arguments for `fn`.
+            tokens (int, optional): The estimated tokens the call consumes. Defaults to 0.
+            timeout (float, optional): Seconds before giving up. Defaults to the controller's timeout.
+            **kwargs: Keyword arguments for `fn`.
+
+        Returns:
+            The return value of `fn`.
+
+        Raises:
+            RateLimitTimeout: If the call cannot be admitted or retried before the deadline.
+            Exception: Any non-throttling error raised by `fn`, or the last throttling error.
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        for attempt in range(self.max_attempts):
+            self.requests.acquire(1, deadline)
+            if tokens:
+                self.tokens.acquire(tokens, deadline)
+            self.limiter.acquire(deadline)
+            throttled = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                if not throttled or attempt == self.max_attempts - 1:
+                    raise
+                self.throttled += 1
+                self.requests.drain()
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+                if time.monotonic() + delay > deadline:
+                    raise
+            finally:
+                self.limiter.release(throttled)
+            self.retries += 1
+            time.sleep(delay)
+        raise RateLimitTimeout("Exhausted retry attempts")
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_model_quota(model_id: str) -> tuple[float, float]:
+    """
+    Look up the configured quota for a model.
+
+    Args:
+        model_id (str): The Bedrock model ID, with or without a cross-region prefix such as "us.".
+
+    Returns:
+        tuple[float, float]: Requests per minute and tokens per minute.
+    """
+    for prefix, quota in MODEL_QUOTAS.items():
+        if prefix in model_id:
+            return quota
+    return DEFAULT_QUOTA
+
+
+def get_rate_controller(model_id: str) -> RateController:
+    """
+    Get the process-wide RateController for a model, shared by every Streamlit session.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+
+    Returns:
+        RateController: The controller for the model.
+    """
+    with _controllers_lock:
+        controller = _controllers.get(model_id)
+        if controller is None:
+            requests_per_minute, tokens_per_minute = get_model_quota(model_id)
+            controller = RateController(requests_per_minute, tokens_per_minute)
+            _controllers[model_id] = controller
+        return controller
+
+
+def estimate_request_tokens(request: dict) -> int:
+    """
+    Estimate the tokens a bedrock-runtime request consumes: its input plus the output it may generate.
+
+    Args:
+        request (dict): The keyword arguments of a `converse`, `converse_stream`, `invoke_model` or
+                        `invoke_model_with_response_stream` call.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    if "messages" in request:
+        tokens = sum(estimate_tokens(message) for message in request["messages"])
+        tokens += sum(estimate_text_tokens(block.get("text", "")) for block in request.get("system", []))
+        return tokens + request.get("inferenceConfig", {}).get("maxTokens", 0)
+    body = request.get("body", "")
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    try:
+        parsed = json.loads(text) if isinstance(text, str) else text
+    except ValueError:
+        parsed = {}
+    max_tokens = (
+        parsed.get("max_tokens")
+        or parsed.get("max_gen_len")
+        or parsed.get("textGenerationConfig", {}).get("maxTokenCount")
+        or 0
+    )
+    return estimate_text_tokens(text if isinstance(text, str) else json.dumps(text)) + max_tokens
+
+
+class RateControlledClient:
+    """
+    A bedrock-runtime client whose model calls go through the process-wide RateController of the
+    model they name, for code that calls the client itself (e.g. LangChain's ChatBedrock).
+    Everything else is passed through to the wrapped client.
+
+    For streaming calls the controller covers opening the stream, which is when Bedrock throttles.
+    """
+
+    RATE_CONTROLLED_OPERATIONS = ("converse", "converse_stream", "invoke_model", "invoke_model_with_response_stream")
+
+    def __init__(self, client):
+        """
+        Initialize the RateControlledClient.
+
+        Args:
+            client: The bedrock-runtime client, created with RATE_CONTROLLED_CLIENT_CONFIG so only the controller retries.
+        """
+        self.client = client
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.client, name)
+        if name not in self.RATE_CONTROLLED_OPERATIONS:
+            return attribute
+
+        def call(**kwargs):
+            return get_rate_controller(kwargs["modelId"]).call(attribute, tokens=estimate_request_tokens(kwargs), **kwargs)
+
+        return call
+
+
+def get_rate_controlled_client(region_name: Optional[str] = None) -> RateControlledClient:
+    """
+    Get a bedrock-runtime client for a region whose model calls are rate controlled.
+
+    Args:
+        region_name (str, optional): The AWS region. Defaults to None (the session's default region).
+
+    Returns:
+        RateControlledClient: The client.
+    """
+    return RateControlledClient(get_client("bedrock-runtime", region_name=region_name, **RATE_CONTROLLED_CLIENT_CONFIG))
@@ -0,0 +1,128 @@
+"""
+Local reranking of retrieved chunks with vectorized lexical and embedding scores
+"""
+
+import re
+from collections import Counter
+from typing import Callable, Optional
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+HASH_MULTIPLIER = 1000003
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def hashed_ngram_embeddings(texts: list[str], dimension: int = 1024, n: int = 3) -> np.ndarray:
+    """
+    Cheap local embeddings: character n-grams hashed into a fixed number of buckets and L2-normalized.
+
+    Args:
+        texts (list[str]): The texts to embed.
+        dimension (int, optional): The number of hash buckets. Defaults to 1024.
+        n (int, optional): The n-gram length. Defaults to 3.
+
+    Returns:
+        np.ndarray: A (len(texts), dimension) float32 array.
+    """
+    vectors = np.zeros((len(texts), dimension), dtype=np.float32)
+    for row, text in enumerate(texts):
+        data = np.frombuffer(f" {' '.join(tokenize(text))} ".encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        if len(data) < n:
+            continue
+        # Polynomial hash of every n-byte window, computed over the whole text at once
+        hashes = np.zeros(len(data) - n + 1, dtype=np.uint64)
+        for offset in range(n):
+            hashes = hashes * np.uint64(HASH_MULTIPLIER) + data[offset:len(data) - n + 1 + offset]
+        vectors[row] = np.bincount((hashes % np.uint64(dimension)).astype(np.int64), minlength=dimension)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def bm25_scores(query: str, texts: list[str], k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """
+    Score texts against a query with BM25, using the candidate set itself for document frequencies.
+
+    Args:
+        query (str): The query text.
+        texts (list[str]): The candidate texts.
+        k1 (float, optional): The term frequency saturation. Defaults to 1.2.
+        b (float, optional): The length normalization. Defaults to 0.75.
+
+    Returns:
+        np.ndarray: One score per text.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not texts:
+        return np.zeros(len(texts), dtype=np.float32)
+    counts = [Counter(tokenize(text)) for text in texts]
+    tf = np.array([[c.get(term, 0) for term in terms] for c in counts], dtype=np.float32)
+    lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / (lengths.mean() or 1))
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _minmax(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min() if len(values) else 0
+    return (values - values.min()) / spread if spread > 0 else np.ones_like(values)
+
+
+class Reranker:
+    """
+    Rescores retrieval candidates with a weighted mix of BM25, embedding similarity and the
+    original retrieval score, and keeps the top k.
+    """
+
+    def __init__(
+        self,
+        embed_many: Optional[Callable[[list[str]], np.ndarray]] = None,
+        lexical_weight: float = 0.4,
+        semantic_weight: float = 0.4,
+        retrieval_weight: float = 0.2,
+    ):
+        """
+        Initialize the Reranker.
+
+        Args:
+            embed_many (callable, optional): Maps a list of texts to an array of L2-normalized embeddings.
+                                             Defaults to `hashed_ngram_embeddings`.
+            lexical_weight (float, optional): The weight of the BM25 score. Defaults to 0.4.
+            semantic_weight (float, optional): The weight of the embedding similarity. Defaults to 0.4.
+            retrieval_weight (float, optional): The weight of the original retrieval score. Defaults to 0.2.
+        """
+        self.embed_many = embed_many or hashed_ngram_embeddings
+        self.lexical_weight = lexical_weight
+        self.semantic_weight = semantic_weight
+        self.retrieval_weight = retrieval_weight
+
+    def rerank(self, query: str, docs: list[dict], top_k: int) -> list[dict]:
+        """
+        Rerank retrieval results for a query.
+
+        Args:
+            query (str): The query text.
+            docs (list[dict]): Retrieval results with "content" and an optional "score".
+            top_k (int): The number of results to keep.
+
+        Returns:
+            list[dict]: The best `top_k` results, each a copy with an added "rerankScore".
+        """
+        if not docs:
+            return []
+        texts = [doc["content"]["text"] for doc in docs]
+        lexical = _minmax(bm25_scores(query, texts))
+        embeddings = self.embed_many([query] + texts)
+        semantic = _minmax(embeddings[1:] @ embeddings[0])
+        retrieval = _minmax(np.array([doc.get("score", 0.0) for doc in docs], dtype=np.float32))
+        combined = (
+            self.lexical_weight * lexical
+            + self.semantic_weight * semantic
+            + self.retrieval_weight * retrieval
+        )
+        order = np.argsort(-combined, kind="stable")[:top_k]
+        return [{**docs[i], "rerankScore": float(combined[i])} for i in order]
@@ -0,0 +1,203 @@
+"""
+Two-tier cache for deterministic Bedrock responses
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+
+def _canonical_default(value):
+    """
+    JSON fallback for values that are not natively serializable.
+
+    Attached files are hashed rather than embedded, so the key stays small while
+    still changing whenever the file content changes.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"__bytes_sha256__": hashlib.sha256(value).hexdigest()}
+    return str(value)
+
+
+def request_key(**request) -> str:
+    """
+    Build a canonical hash for a converse request.
+
+    Args:
+        **request: The keyword arguments passed to `converse` (modelId, messages, inferenceConfig, ...).
+
+    Returns:
+        str: A hex digest that is identical for identical requests.
+    """
+    canonical = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), default=_canonical_default
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    An in-process LRU cache backed by an optional SQLite file that several worker processes can share.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: Optional[float] = 24 * 60 * 60,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 10_000,
+    ):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            max_entries (int, optional): The maximum number of responses kept in memory. Defaults to 256.
+            ttl_seconds (float, optional): How long a response stays valid. None disables expiry. Defaults to one day.
+            db_path (str, optional): The path of the SQLite file for the on-disk tier. Defaults to None (memory only).
+            max_disk_entries (int, optional): The maximum number of responses kept on disk. Defaults to 10,000.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _remember(self, key: str, value: dict, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a cached response.
+
+        Args:
+            key (str): The request key built by `request_key`.
+
+        Returns:
+            dict: The cached response, or None on a miss.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if self._expired(row[1]):
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    else:
+                        conn.execute(
+                            "UPDATE responses SET accessed = ? WHERE key = ?",
+                            (time.time(), key),
+                        )
+                        value = json.loads(row[0])
+                        with self._lock:
+                            self._remember(key, value, row[1])
+                            self.hits += 1
+                            self.disk_hits += 1
+                        return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        """
+        Store a response in both tiers.
+
+        Args:
+            key (str): The request key built by `request_key`.
+            value (dict): The response to cache. Must be JSON serializable for the on-disk tier.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, default=str), now, now),
+                )
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                if self.ttl_seconds is not None:
+                    conn.execute(
+                        "DELETE FROM responses WHERE created < ?",
+                        (now - self.ttl_seconds,),
+                    )
+
+    def clear(self) -> None:
+        """
+        Remove every entry from both tiers and reset the counters.
+        """
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = self.disk_hits = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """
+        Report cache effectiveness.
+
+        Returns:
+            dict: Hit, miss and size counters.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
@@ -0,0 +1,288 @@
+"""
+Semantic cache for knowledge base retrievals
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+from botocore.exceptions import BotoCoreError, ClientError
+
+from utils.clients import get_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "amazon.titan-embed-text-v2:0"
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query so trivially different phrasings share a cache entry
+    (case, punctuation and whitespace are ignored).
+
+    Args:
+        text (str): The query text.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def bedrock_embedder(client, model_id: str = DEFAULT_EMBEDDING_MODEL) -> Callable[[str], list[float]]:
+    """
+    Build an embedding function backed by a Bedrock Titan text embedding model.
+
+    Args:
+        client: The Bedrock Runtime client object.
+        model_id (str, optional): The embedding model ID. Defaults to "amazon.titan-embed-text-v2:0".
+
+    Returns:
+        callable: A function that maps a string to its embedding vector.
+    """
+
+    def embed(text: str) -> list[float]:
+        response = client.invoke_model(
+            modelId=model_id,
+            body=json.dumps({"inputText": text}),
+            contentType="application/json",
+            accept="application/json",
+        )
+        return json.loads(response["body"].read())["embedding"]
+
+    return embed
+
+
+@dataclass
+class _Entry:
+    query: str
+    embedding: Optional[np.ndarray]
+    results: list
+    created: float
+
+
+class RetrievalCache:
+    """
+    Caches retrieval results per knowledge base. Lookups match on normalized text first and fall back
+    to cosine similarity between query embeddings when an embedding function is configured. With an
+    agent client, lookups also drop a knowledge base's entries once it has been re-ingested.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], list[float]]] = None,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        ttl_seconds: Optional[float] = 600,
+        max_entries: int = 512,
+        ingestion_check_interval: float = 60,
+        agent_client=None,
+    ):
+        """
+        Initialize the RetrievalCache.
+
+        Args:
+            embed (callable, optional): Maps a query to an embedding vector. Defaults to None (exact matches only).
+            similarity_threshold (float, optional): The minimum cosine similarity for a semantic hit. Defaults to 0.92.
+            ttl_seconds (float, optional): How long results stay valid. None disables expiry. Defaults to 600.
+            max_entries (int, optional): The maximum number of queries cached per namespace. Defaults to 512.
+            ingestion_check_interval (float, optional): Minimum seconds between ingestion job checks. Defaults to 60.
+            agent_client (optional): The Bedrock Agent client used to check for new ingestion jobs.
+                                     Defaults to None (no checks).
+        """
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.ingestion_check_interval = ingestion_check_interval
+        self.agent_client = agent_client
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._namespaces = {}
+        self._ingestion_state = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def namespace(kb_id: str, params: Optional[dict] = None) -> tuple:
+        """
+        Build the namespace for a knowledge base and retrieval configuration.
+        """
+        return kb_id, json.dumps(params or {}, sort_keys=True, default=str)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl_seconds is not None and time.time() - entry.created > self.ttl_seconds
+
+    def get_or_retrieve(
+        self,
+        kb_id: str,
+        params: Optional[dict],
+        query: str,
+        retrieve: Callable[[str], list],
+        check_ingestion: bool = True,
+    ) -> list:
+        """
+        Return cached results for a query or call `retrieve` and cache its results.
+
+        Args:
+            kb_id (str): The knowledge base ID.
+            params (dict, optional): The retrieval configuration; different configurations are cached separately.
+            query (str): The query text.
+            retrieve (callable): Performs the retrieval for the query on a miss.
+            check_ingestion (bool, optional): Check for re-ingestion first when an agent client is configured
+                                              (at most once per `ingestion_check_interval`). Defaults to True.
+
+        Returns:
+            list: The retrieval results.
+        """
+        if check_ingestion and self.agent_client is not None:
+            try:
+                self.invalidate_if_reingested(self.agent_client, kb_id)
+            except (BotoCoreError, ClientError) as e:
+                logger.warning("Ingestion check for knowledge base %s failed: %s", kb_id, e)
+
+        namespace = self.namespace(kb_id, params)
+        normalized = normalize_query(query)
+
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+            entry = entries.get(normalized)
+            if entry is not None and not self._expired(entry):
+                entries.move_to_end(normalized)
+                self.hits += 1
+                return entry.results
+
+        embedding = None
+        if self.embed is not None:
+            try:
+                embedding = np.asarray(self.embed(normalized), dtype=np.float32)
+                embedding /= np.linalg.norm(embedding) or 1.0
+            except (BotoCoreError, ClientError) as e:
+                # Serve the lookup as exact-match only rather than failing the retrieval
+                logger.warning("Query embedding for the retrieval cache failed: %s", e)
+        if embedding is not None:
+            with self._lock:
+                candidates = [
+                    (key, e) for key, e in entries.items() if e.embedding is not None and not self._expired(e)
+                ]
+                if candidates:
+                    matrix = np.stack([e.embedding for _, e in candidates])
+                    similarities = matrix @ embedding
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        key, entry = candidates[best]
+                        entries.move_to_end(key)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        return entry.results
+
+        results = retrieve(query)
+        with self._lock:
+            self.misses += 1
+            entries[normalized] = _Entry(normalized, embedding, results, time.time())
+            entries.move_to_end(normalized)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        return results
+
+    def invalidate(self, kb_id: Optional[str] = None) -> None:
+        """
+        Drop cached results for one knowledge base, or for all of them.
+
+        Args:
+            kb_id (str, optional): The knowledge base to invalidate. Defaults to None (all).
+        """
+        with self._lock:
+            for namespace in list(self._namespaces):
+                if kb_id is None or namespace[0] == kb_id:
+                    del self._namespaces[namespace]
+
+    def invalidate_if_reingested(self, agent_client, kb_id: str) -> bool:
+        """
+        Invalidate a knowledge base's entries if any of its data sources finished a new ingestion job
+        since the last check. Checks run at most once per `ingestion_check_interval`. The first check
+        also invalidates, since entries cached before it may predate the latest job.
+
+        Args:
+            agent_client: The Bedrock Agent client object.
+            kb_id (str): The knowledge base ID.
+
+        Returns:
+            bool: True if the cache was invalidated.
+        """
+        now = time.time()
+        with self._lock:
+            previous = self._ingestion_state.get(kb_id)
+            if previous is not None and now - previous["checked"] < self.ingestion_check_interval:
+                return False
+            # Claim the check so concurrent lookups (and retries after a failed check) wait for the interval
+            self._ingestion_state[kb_id] = {"checked": now, "jobs": previous["jobs"] if previous else None}
+
+        latest = []
+        for data_source in agent_client.list_data_sources(knowledgeBaseId=kb_id)["dataSourceSummaries"]:
+            jobs = agent_client.list_ingestion_jobs(
+                knowledgeBaseId=kb_id,
+                dataSourceId=data_source["dataSourceId"],
+                filters=[{"attribute": "STATUS", "operator": "EQ", "values": ["COMPLETE"]}],
+                sortBy={"attribute": "STARTED_AT", "order": "DESCENDING"},
+                maxResults=1,
+            )["ingestionJobSummaries"]
+            if jobs:
+                latest.append(jobs[0]["ingestionJobId"])
+        latest = tuple(sorted(latest))
+
+        with self._lock:
+            self._ingestion_state[kb_id] = {"checked": now, "jobs": latest}
+        if previous is None or previous["jobs"] != latest:
+            self.invalidate(kb_id)
+            return True
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_retrieval_cache(region_name: Optional[str] = None) -> RetrievalCache:
+    """
+    Get the process-wide RetrievalCache for a region, shared by every Streamlit session. It checks
+    for re-ingested knowledge bases with the region's Bedrock Agent client, and matches paraphrased
+    queries by embedding with $RETRIEVAL_CACHE_EMBEDDING_MODEL (default Titan Text Embeddings V2; set it
+    empty for exact matches only) at a cosine similarity of at least $RETRIEVAL_CACHE_SIMILARITY (default 0.92).
+
+    Args:
+        region_name (str, optional): The AWS region. Defaults to None (the session's default region).
+
+    Returns:
+        RetrievalCache: The cache.
+    """
+    with _caches_lock:
+        cache = _caches.get(region_name)
+        if cache is None:
+            embedding_model = os.environ.get("RETRIEVAL_CACHE_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+            cache = RetrievalCache(
+                embed=bedrock_embedder(get_client("bedrock-runtime", region_name=region_name), embedding_model)
+                if embedding_model
+                else None,
+                similarity_threshold=float(os.environ.get("RETRIEVAL_CACHE_SIMILARITY", DEFAULT_SIMILARITY_THRESHOLD)),
+                agent_client=get_client("bedrock-agent", region_name=region_name),
+            )
+            _caches[region_name] = cache
+        return cache
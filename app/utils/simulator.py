@@ -0,0 +1,325 @@
+"""
+Offline stand-in for the Bedrock runtime and knowledge base APIs, for load and latency testing
+"""
+
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from utils.history import estimate_text_tokens, estimate_tokens
+from utils.rerank import hashed_ngram_embeddings
+
+SIMULATED_SERVICES = {"bedrock-runtime", "bedrock-agent-runtime", "bedrock-agent"}
+
+_WORDS = (
+    "product insulation boat cylinder install warranty feature durable lightweight customer "
+    "review quality price efficient design material support guide model series rated energy "
+    "performance safety water heat panel spec dimension easy reliable value compatible"
+).split()
+
+
+@dataclass
+class SimulatorConfig:
+    """
+    Behavior of the simulated service.
+
+    Attributes:
+        seed (int): The seed that makes responses, latencies and throttling deterministic.
+        first_token_latency (float): Seconds before the first output token.
+        tokens_per_second (float): The output token generation rate.
+        jitter (float): The relative random variation applied to latencies (0.1 = +/-10%).
+        throttle_rate (float): The probability that a call fails with ThrottlingException.
+        min_output_tokens (int): The shortest generated response, in tokens.
+        max_output_tokens (int): The longest generated response, in tokens.
+        retrieve_latency (float): Seconds per `retrieve` call.
+        time_scale (float): Multiplies every sleep; 0 runs as fast as possible.
+    """
+
+    seed: int = 0
+    first_token_latency: float = 0.6
+    tokens_per_second: float = 60.0
+    jitter: float = 0.1
+    throttle_rate: float = 0.0
+    min_output_tokens: int = 50
+    max_output_tokens: int = 400
+    retrieve_latency: float = 0.15
+    time_scale: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "SimulatorConfig":
+        """
+        Build a config from BEDROCK_SIMULATOR_* environment variables
+        (e.g. BEDROCK_SIMULATOR_SEED, BEDROCK_SIMULATOR_THROTTLE_RATE).
+
+        Returns:
+            SimulatorConfig: The config with any overrides applied.
+        """
+        config = cls()
+        for name, default in vars(cls()).items():
+            value = os.environ.get(f"BEDROCK_SIMULATOR_{name.upper()}")
+            if value is not None:
+                setattr(config, name, type(default)(value))
+        return config
+
+
+def simulator_enabled() -> bool:
+    """
+    Check whether the BEDROCK_SIMULATOR environment variable asks for the simulator.
+    """
+    return os.environ.get("BEDROCK_SIMULATOR", "").lower() in ("1", "true", "yes")
+
+
+class BedrockSimulator:
+    """
+    Implements `converse`, `converse_stream`, `invoke_model`, `invoke_model_with_response_stream`,
+    `retrieve` and `list_knowledge_bases` with configurable latency, throughput, throttling and
+    response sizes. Safe to share across threads.
+    """
+
+    def __init__(self, config: SimulatorConfig = None, region_name: str = "us-east-1"):
+        """
+        Initialize the BedrockSimulator.
+
+        Args:
+            config (SimulatorConfig, optional): The simulated behavior. Defaults to SimulatorConfig().
+            region_name (str, optional): The region reported in `meta`. Defaults to "us-east-1".
+        """
+        self.config = config or SimulatorConfig()
+        self.meta = SimpleNamespace(region_name=region_name)
+        self.calls = 0
+        self.throttled = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, operation: str, request: dict) -> random.Random:
+        """
+        A random generator seeded from the config seed, the request content and how many times the same
+        request was made, so results don't depend on thread scheduling.
+        """
+        digest = hashlib.sha256(
+            json.dumps(request, sort_keys=True, default=lambda v: len(v) if isinstance(v, bytes) else str(v)).encode()
+        ).hexdigest()
+        with self._lock:
+            self.calls += 1
+            repeat = self._seen.get((operation, digest), 0)
+            self._seen[(operation, digest)] = repeat + 1
+        return random.Random(f"{self.config.seed}:{operation}:{digest}:{repeat}")
+
+    def _sleep(self, seconds: float, rng: random.Random) -> None:
+        jitter = 1 + rng.uniform(-self.config.jitter, self.config.jitter)
+        delay = seconds * jitter * self.config.time_scale
+        if delay > 0:
+            time.sleep(delay)
+
+    def _maybe_throttle(self, operation: str, rng: random.Random) -> None:
+        if rng.random() < self.config.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Too many requests (simulated)"}},
+                operation,
+            )
+
+    def _generate(self, rng: random.Random, max_tokens=None) -> list[str]:
+        upper = self.config.max_output_tokens
+        if max_tokens:
+            upper = min(upper, max_tokens)
+        count = rng.randint(min(self.config.min_output_tokens, upper), upper)
+        return [rng.choice(_WORDS) + " " for _ in range(count)]
+
+    # bedrock-runtime: Converse API
+
+    def _converse(self, operation: str, kwargs: dict):
+        rng = self._rng(operation, kwargs)
+        self._maybe_throttle(operation, rng)
+        input_tokens = sum(estimate_tokens(m) for m in kwargs.get("messages", []))
+        input_tokens += sum(estimate_text_tokens(b.get("text", "")) for b in kwargs.get("system", []))
+        tokens = self._generate(rng, kwargs.get("inferenceConfig", {}).get("maxTokens"))
+        usage = {
+            "inputTokens": input_tokens,
+            "outputTokens": len(tokens),
+            "totalTokens": input_tokens + len(tokens),
+        }
+        return rng, tokens, usage
+
+    def converse(self, **kwargs) -> dict:
+        started = time.perf_counter()
+        rng, tokens, usage = self._converse("Converse", kwargs)
+        self._sleep(self.config.first_token_latency + len(tokens) / self.config.tokens_per_second, rng)
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": "".join(tokens).strip()}]}},
+            "stopReason": "end_turn",
+            "usage": usage,
+            "metrics": {"latencyMs": int((time.perf_counter() - started) * 1000)},
+        }
+
+    def converse_stream(self, **kwargs) -> dict:
+        rng, tokens, usage = self._converse("ConverseStream", kwargs)
+
+        def events():
+            started = time.perf_counter()
+            yield {"messageStart": {"role": "assistant"}}
+            self._sleep(self.config.first_token_latency, rng)
+            for i in range(0, len(tokens), 4):
+                chunk = tokens[i:i + 4]
+                yield {"contentBlockDelta": {"delta": {"text": "".join(chunk)}, "contentBlockIndex": 0}}
+                self._sleep(len(chunk) / self.config.tokens_per_second, rng)
+            yield {"contentBlockStop": {"contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {
+                "metadata": {
+                    "usage": usage,
+                    "metrics": {"latencyMs": int((time.perf_counter() - started) * 1000)},
+                }
+            }
+
+        return {"stream": events()}
+
+    # bedrock-runtime: InvokeModel API (Anthropic messages, Titan and Llama body formats)
+
+    @staticmethod
+    def _invoke_prompt_tokens(body: dict) -> int:
+        if "messages" in body:
+            tokens = 0
+            for message in body["messages"]:
+                content = message["content"]
+                if isinstance(content, str):
+                    tokens += estimate_text_tokens(content)
+                else:
+                    tokens += sum(
+                        estimate_text_tokens(block.get("text", "")) if block.get("type") == "text" else 1600
+                        for block in content
+                    )
+            return tokens + estimate_text_tokens(body.get("system", "") if isinstance(body.get("system"), str) else "")
+        return estimate_text_tokens(body.get("inputText") or body.get("prompt") or "")
+
+    def _invoke(self, operation: str, kwargs: dict):
+        body = kwargs["body"]
+        body = json.loads(body) if isinstance(body, (str, bytes)) else body
+        rng = self._rng(operation, {"modelId": kwargs.get("modelId"), "body": body})
+        self._maybe_throttle(operation, rng)
+        max_tokens = (
+            body.get("max_tokens")
+            or body.get("max_gen_len")
+            or body.get("textGenerationConfig", {}).get("maxTokenCount")
+        )
+        return rng, body, self._invoke_prompt_tokens(body), self._generate(rng, max_tokens)
+
+    def invoke_model(self, **kwargs) -> dict:
+        if "embed" in kwargs.get("modelId", ""):
+            return self._embed(kwargs)
+        rng, body, input_tokens, tokens = self._invoke("InvokeModel", kwargs)
+        self._sleep(self.config.first_token_latency + len(tokens) / self.config.tokens_per_second, rng)
+        text = "".join(tokens).strip()
+        model_id = kwargs.get("modelId", "")
+        if "anthropic" in model_id or "messages" in body:
+            payload = {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": input_tokens, "output_tokens": len(tokens)},
+            }
+        elif "meta" in model_id:
+            payload = {
+                "generation": text,
+                "prompt_token_count": input_tokens,
+                "generation_token_count": len(tokens),
+                "stop_reason": "stop",
+            }
+        else:
+            payload = {
+                "inputTextTokenCount": input_tokens,
+                "results": [{"tokenCount": len(tokens), "outputText": text, "completionReason": "FINISH"}],
+            }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8")), "contentType": "application/json"}
+
+    def _embed(self, kwargs: dict) -> dict:
+        # Hashed character n-grams: deterministic, and close for texts that share most of their wording
+        body = json.loads(kwargs["body"])
+        rng = self._rng("InvokeModel", {"modelId": kwargs.get("modelId"), "body": body})
+        self._maybe_throttle("InvokeModel", rng)
+        self._sleep(self.config.first_token_latency, rng)
+        text = body.get("inputText", "")
+        payload = {
+            "embedding": hashed_ngram_embeddings([text], dimension=body.get("dimensions", 1024))[0].tolist(),
+            "inputTextTokenCount": estimate_text_tokens(text),
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8")), "contentType": "application/json"}
+
+    def invoke_model_with_response_stream(self, **kwargs) -> dict:
+        rng, body, input_tokens, tokens = self._invoke("InvokeModelWithResponseStream", kwargs)
+
+        def chunk(event: dict) -> dict:
+            return {"chunk": {"bytes": json.dumps(event).encode("utf-8")}}
+
+        def events():
+            started = time.perf_counter()
+            yield chunk({"type": "message_start", "message": {"role": "assistant", "usage": {"input_tokens": input_tokens}}})
+            self._sleep(self.config.first_token_latency, rng)
+            for i in range(0, len(tokens), 4):
+                piece = tokens[i:i + 4]
+                yield chunk({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "".join(piece)}})
+                self._sleep(len(piece) / self.config.tokens_per_second, rng)
+            yield chunk({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(tokens)}})
+            yield chunk(
+                {
+                    "type": "message_stop",
+                    "amazon-bedrock-invocationMetrics": {
+                        "inputTokenCount": input_tokens,
+                        "outputTokenCount": len(tokens),
+                        "invocationLatency": int((time.perf_counter() - started) * 1000),
+                    },
+                }
+            )
+
+        return {"body": events(), "contentType": "application/json"}
+
+    # bedrock-agent-runtime / bedrock-agent
+
+    def retrieve(self, **kwargs) -> dict:
+        rng = self._rng("Retrieve", kwargs)
+        self._maybe_throttle("Retrieve", rng)
+        self._sleep(self.config.retrieve_latency, rng)
+        count = (
+            kwargs.get("retrievalConfiguration", {})
+            .get("vectorSearchConfiguration", {})
+            .get("numberOfResults", 5)
+        )
+        score = 0.9
+        results = []
+        for i in range(count):
+            score -= rng.uniform(0.01, 0.1)
+            results.append(
+                {
+                    "content": {"text": "".join(rng.choice(_WORDS) + " " for _ in range(rng.randint(80, 300))).strip()},
+                    "location": {
+                        "type": "S3",
+                        "s3Location": {"uri": f"s3://simulated-kb/{kwargs.get('knowledgeBaseId', 'kb')}/doc-{rng.randint(1, 20)}.pdf"},
+                    },
+                    "score": round(max(score, 0.0), 4),
+                    "metadata": {"x-amz-bedrock-kb-chunk-id": f"chunk-{rng.getrandbits(32):08x}"},
+                }
+            )
+        return {"retrievalResults": results}
+
+    def list_data_sources(self, **kwargs) -> dict:
+        return {"dataSourceSummaries": [{"dataSourceId": "SIMDS00001", "status": "AVAILABLE"}]}
+
+    def list_ingestion_jobs(self, **kwargs) -> dict:
+        return {"ingestionJobSummaries": [{"ingestionJobId": "SIMJOB0001", "status": "COMPLETE"}]}
+
+    def list_knowledge_bases(self, **kwargs) -> dict:
+        return {
+            "knowledgeBaseSummaries": [
+                {"knowledgeBaseId": "SIMKB00001", "name": "simulated-product-docs", "status": "ACTIVE"}
+            ]
+        }
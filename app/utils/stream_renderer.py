@@ -0,0 +1,106 @@
+"""
+Frame-rate-limited rendering of streamed model output into a Streamlit placeholder
+"""
+
+import time
+from typing import Iterable, Optional
+
+
+class StreamRenderer:
+    """
+    Accumulates streamed text deltas and re-renders the placeholder at most once per frame interval
+    (or sooner when enough text is pending), instead of once per delta.
+    """
+
+    def __init__(
+        self,
+        placeholder,
+        interval: float = 0.1,
+        max_pending_bytes: int = 4096,
+        cursor: str = "▌",
+    ):
+        """
+        Initialize the StreamRenderer.
+
+        Args:
+            placeholder: The Streamlit element to render into, e.g. `st.empty()`.
+            interval (float, optional): The minimum seconds between renders. Defaults to 0.1.
+            max_pending_bytes (int, optional): Render early once this much text is pending. Defaults to 4096.
+            cursor (str, optional): Appended while streaming to show the reply is still arriving. Defaults to "▌".
+        """
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending_bytes = max_pending_bytes
+        self.cursor = cursor
+        self.renders = 0
+        self._parts = []
+        self._pending = 0
+        self._last_render = 0.0
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        """
+        The full text received so far.
+        """
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    def write(self, delta: str) -> None:
+        """
+        Add a text delta, rendering if the frame interval has passed or the pending text is large.
+
+        Args:
+            delta (str): The new text.
+        """
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._text = None
+        self._pending += len(delta)
+        if self._pending >= self.max_pending_bytes or time.monotonic() - self._last_render >= self.interval:
+            self.flush(final=False)
+
+    def flush(self, final: bool = True) -> str:
+        """
+        Render everything received so far.
+
+        Args:
+            final (bool, optional): Render without the cursor. Defaults to True.
+
+        Returns:
+            str: The full text.
+        """
+        text = self.text
+        self.placeholder.markdown(text if final else text + self.cursor)
+        self.renders += 1
+        self._pending = 0
+        self._last_render = time.monotonic()
+        return text
+
+    def __enter__(self) -> "StreamRenderer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
+
+
+def render_stream(placeholder, deltas: Iterable[str], interval: Optional[float] = None) -> str:
+    """
+    Render an iterable of text deltas into a placeholder, e.g. a `BedrockHandler.stream_text` stream.
+
+    Args:
+        placeholder: The Streamlit element to render into.
+        deltas (Iterable[str]): The text deltas.
+        interval (float, optional): The minimum seconds between renders. Defaults to the StreamRenderer default.
+
+    Returns:
+        str: The full text.
+    """
+    options = {} if interval is None else {"interval": interval}
+    with StreamRenderer(placeholder, **options) as renderer:
+        for delta in deltas:
+            renderer.write(delta)
+    return renderer.text
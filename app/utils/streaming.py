@@ -0,0 +1,101 @@
+"""
+Iterates converse_stream responses as plain text and records latency metrics
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+
+@dataclass
+class StreamSummary:
+    """
+    Final statistics for a streamed response.
+
+    Attributes:
+        stop_reason (str, optional): The reason the model stopped, or "cancelled" if the caller stopped the stream.
+        usage (dict): The token usage reported by Bedrock (inputTokens, outputTokens, totalTokens, ...).
+        server_latency_ms (int, optional): The latency reported by Bedrock in the metadata event.
+        time_to_first_token (float, optional): Seconds from the request to the first text delta.
+        total_latency (float, optional): Seconds from the request to the end of the stream.
+        tokens_per_second (float, optional): Output tokens divided by the time spent generating them.
+    """
+
+    stop_reason: Optional[str] = None
+    usage: dict = field(default_factory=dict)
+    server_latency_ms: Optional[int] = None
+    time_to_first_token: Optional[float] = None
+    total_latency: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+
+
+class ConverseTextStream:
+    """
+    A generator-style wrapper around a `converse_stream` call that yields text deltas as they arrive.
+
+    The summary is complete once iteration finishes, either because the stream ended or
+    because `cancel` was called.
+    """
+
+    def __init__(self, start_stream, started_at: Optional[float] = None):
+        """
+        Initialize the ConverseTextStream.
+
+        Args:
+            start_stream: A callable that issues the `converse_stream` request and returns its response.
+            started_at (float, optional): A `time.perf_counter` timestamp for when the request was issued.
+                                          Defaults to the time the stream is first iterated.
+        """
+        self._start_stream = start_stream
+        self._started_at = started_at
+        self._cancelled = threading.Event()
+        self.summary = StreamSummary()
+        self.text_parts = []
+
+    @property
+    def text(self) -> str:
+        """
+        The text received so far.
+        """
+        return "".join(self.text_parts)
+
+    def cancel(self) -> None:
+        """
+        Stop the stream early. Safe to call from another thread.
+        """
+        self._cancelled.set()
+
+    def __iter__(self) -> Iterator[str]:
+        started_at = self._started_at or time.perf_counter()
+        first_token_at = None
+        event_stream = self._start_stream()["stream"]
+        try:
+            for event in event_stream:
+                if self._cancelled.is_set():
+                    self.summary.stop_reason = "cancelled"
+                    break
+                if "contentBlockDelta" in event:
+                    text = event["contentBlockDelta"]["delta"].get("text")
+                    if text:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            self.summary.time_to_first_token = first_token_at - started_at
+                        self.text_parts.append(text)
+                        yield text
+                elif "messageStop" in event:
+                    self.summary.stop_reason = event["messageStop"].get("stopReason")
+                elif "metadata" in event:
+                    self.summary.usage = event["metadata"].get("usage", {})
+                    self.summary.server_latency_ms = (
+                        event["metadata"].get("metrics", {}).get("latencyMs")
+                    )
+        finally:
+            close = getattr(event_stream, "close", None)
+            if close is not None:
+                close()
+            finished_at = time.perf_counter()
+            self.summary.total_latency = finished_at - started_at
+            output_tokens = self.summary.usage.get("outputTokens")
+            if output_tokens and first_token_at is not None and finished_at > first_token_at:
+                self.summary.tokens_per_second = output_tokens / (finished_at - first_token_at)
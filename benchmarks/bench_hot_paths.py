@@ -0,0 +1,303 @@
+"""
+Micro-benchmarks for the message-building, KB parsing and PDF hot paths.
+
+Records the median wall time and peak traced memory of each benchmark, optionally saves the
+results as a baseline, and flags regressions against a saved baseline.
+
+    python benchmarks/bench_hot_paths.py --save            # record a baseline
+    python benchmarks/bench_hot_paths.py                   # compare against it
+    python benchmarks/bench_hot_paths.py -k kb_parse       # run matching benchmarks only
+"""
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.absolute()
+APP_DIR = ROOT / "app"
+STATIC_DIR = APP_DIR / "static"
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+sys.path.insert(0, str(APP_DIR))
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function does any setup and returns the callable to time.
+    """
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class UploadedFile(io.BytesIO):
+    """
+    Mimics Streamlit's UploadedFile (a BytesIO with a name and file_id).
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path.read_bytes())
+        self.name = path.name
+        self.file_id = path.name
+
+
+def make_kb_results(count: int, words: int = 300) -> list[dict]:
+    text = " ".join(f"word{i % 97}" for i in range(words))
+    return [
+        {
+            "content": {"text": f"{i} {text}"},
+            "location": {"type": "S3", "s3Location": {"uri": f"s3://bucket/docs/doc-{i}.pdf"}},
+            "score": 1 - i / count,
+        }
+        for i in range(count)
+    ]
+
+
+@benchmark("user_message_attachments")
+def bench_user_message():
+    from utils.bedrock import BedrockHandler
+
+    paths = [STATIC_DIR / "awsgsg-intro.pdf", STATIC_DIR / "boat.jpg", STATIC_DIR / "insulation.jpg"]
+    files = [UploadedFile(path) for path in paths]
+
+    def run():
+        BedrockHandler.user_message("Describe these products", context="Some context", uploaded_files=files)
+
+    return run
+
+
+@benchmark("kb_parse_to_string_1000")
+def bench_kb_parse_to_string():
+    from utils.bedrock import KBHandler
+
+    docs = make_kb_results(1000)
+    return lambda: KBHandler.parse_kb_output_to_string(docs)
+
+
+@benchmark("kb_parse_to_reference_1000")
+def bench_kb_parse_to_reference():
+    from utils.bedrock import KBHandler
+
+    docs = make_kb_results(1000)
+    return lambda: KBHandler.parse_kb_output_to_reference(docs)
+
+
+@benchmark("rerank_15_candidates")
+def bench_rerank():
+    from utils.rerank import Reranker
+
+    # The chat page over-fetches 15 candidates of ~300 words; this is the latency added per question
+    docs = make_kb_results(15)
+    reranker = Reranker()
+    return lambda: reranker.rerank("word3 word42 word96 pricing", docs, 3)
+
+
+@benchmark("bm25_search_5000")
+def bench_bm25_search():
+    from utils.bm25 import BM25Index
+
+    index = BM25Index()
+    index.add(
+        [f"Model AB-{1000 + i} has {i % 50} watts of power and a steel body" for i in range(5000)],
+        [f"s3://bucket/docs/doc-{i}.pdf" for i in range(5000)],
+    )
+    return lambda: index.search("AB-1200 power steel", 10)
+
+
+@benchmark("stream_render_4096_tokens")
+def bench_stream_render():
+    from utils.stream_renderer import render_stream
+
+    class Placeholder:
+        # Stands in for st.empty(); the cost of a render is proportional to the text sent
+        def markdown(self, text):
+            len(text.encode("utf-8"))
+
+    deltas = [f"tok{i % 10} " for i in range(4096)]
+    return lambda: render_stream(Placeholder(), deltas)
+
+
+@benchmark("extract_text_from_pdf")
+def bench_extract_text_from_pdf():
+    from utils.pdf import extract_text_from_pdf
+
+    data = (STATIC_DIR / "awsgsg-intro.pdf").read_bytes()
+    return lambda: extract_text_from_pdf(io.BytesIO(data))
+
+
+@benchmark("extract_text_cached_hit")
+def bench_extract_text_cached():
+    from utils.pdf import PDFTextCache
+
+    # What a rerun pays once the upload has been extracted: hashing plus an in-memory lookup
+    cache = PDFTextCache()
+    data = (STATIC_DIR / "awsgsg-intro.pdf").read_bytes()
+    cache.get_or_extract(data)
+    return lambda: cache.get_or_extract(data)
+
+
+@benchmark("image_base64")
+def bench_base64():
+    from utils.images import get_base64_from_bytes
+
+    data = (STATIC_DIR / "boat.jpg").read_bytes()
+    return lambda: get_base64_from_bytes(data)
+
+
+@benchmark("image_request_body")
+def bench_request_body():
+    from utils.images import get_request_body
+
+    data = (STATIC_DIR / "boat.jpg").read_bytes()
+    return lambda: get_request_body("Describe this image.", data)
+
+
+@benchmark("faq_text_splitter")
+def bench_text_splitter():
+    import PyPDF2
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # One document per page, like PyPDFLoader
+    reader = PyPDF2.PdfReader(str(STATIC_DIR / "beginners-guide.pdf"))
+    documents = [Document(page_content=page.extract_text()) for page in reader.pages]
+    # Same settings as Document_FAQ_Generator.get_docs
+    splitter = RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", ".", " "], chunk_size=10000, chunk_overlap=0
+    )
+    return lambda: splitter.split_documents(documents=documents)
+
+
+def measure(run, repeat: int, min_time: float) -> dict:
+    """
+    Time a callable and trace its peak memory.
+
+    Args:
+        run (callable): The code to measure.
+        repeat (int): The number of timed samples to take.
+        min_time (float): The minimum seconds per sample; fast callables are looped to reach it.
+
+    Returns:
+        dict: The median and minimum seconds per call and the peak memory in bytes.
+    """
+    run()  # warm up imports and caches
+
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        if time.perf_counter() - start >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        samples.append((time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "peak_bytes": peak}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Find benchmarks that got slower or used more memory than the baseline allows.
+
+    Args:
+        results (dict): The current results by benchmark name.
+        baseline (dict): The saved results by benchmark name.
+        threshold (float): The allowed relative increase (0.2 = 20%).
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or "median_s" not in result or "median_s" not in before:
+            continue
+        for metric in ("median_s", "peak_bytes"):
+            if before[metric] and result[metric] > before[metric] * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {before[metric]:.6g} -> {result[metric]:.6g} "
+                    f"(+{(result[metric] / before[metric] - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the hot path micro-benchmarks")
+    parser.add_argument("-k", "--filter", type=str, default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7, help="Number of timed samples per benchmark")
+    parser.add_argument("--min_time", type=float, default=0.2, help="Minimum seconds per sample")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        try:
+            run = setup()
+        except ImportError as e:
+            print(f"{name:<32} skipped ({e})")
+            results[name] = {"skipped": str(e)}
+            continue
+        result = measure(run, args.repeat, args.min_time)
+        results[name] = result
+        print(f"{name:<32} {result['median_s'] * 1000:>10.3f} ms  {result['peak_bytes'] / 1024:>10.1f} KiB peak")
+
+    if args.save:
+        payload = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": {
+                **_load_baseline(args.baseline),
+                **{name: result for name, result in results.items() if "skipped" not in result},
+            },
+        }
+        args.baseline.write_text(json.dumps(payload, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        regressions = compare(results, _load_baseline(args.baseline), args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+def _load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text()).get("results", {})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
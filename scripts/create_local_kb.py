@@ -0,0 +1,86 @@
+"""
+Builds a local FAISS knowledge base from the documents in ../data, for use with LocalKBHandler
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import boto3
+from pypdf import PdfReader
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "app"))
+
+from utils.local_kb import LocalVectorIndex  # noqa: E402
+from utils.retrieval_cache import bedrock_embedder  # noqa: E402
+
+EMBEDDING_DIMENSIONS = {
+    "amazon.titan-embed-text-v1": 1536,
+    "amazon.titan-embed-text-v2:0": 1024,
+}
+
+
+def read_documents(path: Path) -> dict[str, str]:
+    """
+    Read the text of every PDF, text and markdown file in a directory.
+
+    Args:
+        path (Path): The directory containing the documents.
+
+    Returns:
+        dict[str, str]: Document text keyed by file URI.
+    """
+    documents = {}
+    for file in sorted(path.rglob("*")):
+        if file.suffix.lower() == ".pdf":
+            text = "\n".join(page.extract_text() or "" for page in PdfReader(file).pages)
+        elif file.suffix.lower() in (".txt", ".md"):
+            text = file.read_text(encoding="utf-8")
+        else:
+            continue
+        documents[file.absolute().as_uri()] = text
+    return documents
+
+
+def main():
+    path = Path(__file__).parent.absolute()
+    parser = argparse.ArgumentParser(
+        description="Create or update a local FAISS knowledge base from a directory of documents"
+    )
+    parser.add_argument(
+        "--data_dir", type=str, required=False, help="Directory with the documents to index", default=str(path / "data")
+    )
+    parser.add_argument(
+        "--output_dir", type=str, required=False, help="Directory to write the index to", default=str(path / "local_kb")
+    )
+    parser.add_argument(
+        "--region_name", type=str, required=False, help="AWS region name", default="us-east-1"
+    )
+    parser.add_argument(
+        "--embedding_model",
+        type=str,
+        required=False,
+        help="Bedrock embedding model ID",
+        default="amazon.titan-embed-text-v2:0",
+        choices=list(EMBEDDING_DIMENSIONS),
+    )
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    if (output_dir / "index.faiss").exists():
+        index = LocalVectorIndex.load(str(output_dir))
+        print(f"Loaded existing index with {len(index)} chunks")
+        if index.embedding_model and index.embedding_model != args.embedding_model:
+            parser.error(f"The existing index was built with {index.embedding_model}")
+    else:
+        index = LocalVectorIndex(EMBEDDING_DIMENSIONS[args.embedding_model], embedding_model=args.embedding_model)
+
+    client = boto3.client("bedrock-runtime", region_name=args.region_name)
+    embed = bedrock_embedder(client, args.embedding_model)
+    added = index.add_documents(read_documents(Path(args.data_dir)), embed)
+    index.save(str(output_dir))
+    print(f"Added {added} chunks; index at {output_dir} has {len(index)} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app imports its helpers as top-level "utils.*", with app/ as the working directory
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
@@ -0,0 +1,34 @@
+import threading
+
+from utils.bedrock import BedrockHandler
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.started = []
+        self.lock = threading.Lock()
+
+    def converse(self, **request):
+        with self.lock:
+            self.started.append(request["messages"][0]["content"][0]["text"])
+        return {"output": {"message": {"role": "assistant", "content": [{"text": "ok"}]}}}
+
+
+class PassThroughController:
+    def call(self, fn, *args, tokens=0, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def test_breaking_out_of_a_batch_cancels_pending_calls():
+    client = FakeRuntime()
+    handler = BedrockHandler(client, "amazon.titan-text-express-v1", params={}, rate_controller=PassThroughController())
+    batch = [[BedrockHandler.user_message(f"question {i}")] for i in range(20)]
+
+    results = handler.iter_model_batch(batch, max_concurrency=1)
+    first = next(results)
+    results.close()
+
+    assert first.index == 0 and first.error is None
+    # The one worker may have picked up the next item before the close; nothing after that starts
+    assert len(client.started) <= 2
+    assert client.started[0] == "question: question 0"
@@ -0,0 +1,22 @@
+from utils.context_packer import pack_context
+
+
+def doc(text, score):
+    return {"content": {"text": text}, "score": score, "location": {"type": "S3"}}
+
+
+def test_chunk_without_overlap_is_unchanged():
+    text = "# Installation\n\n1. Remove the cover.\n2. Attach the bracket.\n\n| Part | Qty |\n|------|-----|\n| M4   | 6   |\n"
+    packed = pack_context([doc(text, 0.9)], max_tokens=2000)
+
+    assert packed.docs[0]["content"]["text"] == text
+    assert packed.trimmed_tokens == 0
+
+
+def test_overlap_is_cut_from_the_original_text():
+    shared = "the heater ships with a two year limited warranty\ncovering parts and labour"
+    first = f"Overview of the heater.\n\n{shared}"
+    second = f"{shared}\n\n- Register online\n- Keep the receipt"
+    packed = pack_context([doc(first, 0.9), doc(second, 0.8)], max_tokens=2000)
+
+    assert [d["content"]["text"] for d in packed.docs] == [first, "- Register online\n- Keep the receipt"]
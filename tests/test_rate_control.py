@@ -0,0 +1,31 @@
+import json
+
+from utils import rate_control
+
+
+class FakeController:
+    def __init__(self):
+        self.calls = []
+
+    def call(self, fn, *args, tokens=0, **kwargs):
+        self.calls.append(tokens)
+        return fn(*args, **kwargs)
+
+
+class FakeRuntime:
+    meta = "meta"
+
+    def invoke_model(self, **kwargs):
+        return {"modelId": kwargs["modelId"]}
+
+
+def test_client_charges_prompt_and_max_tokens(monkeypatch):
+    controller = FakeController()
+    monkeypatch.setattr(rate_control, "get_rate_controller", lambda model_id: controller)
+    client = rate_control.RateControlledClient(FakeRuntime())
+    body = json.dumps({"prompt": "review " * 10000, "max_tokens": 4000})
+
+    assert client.invoke_model(modelId="anthropic.claude-v2", body=body) == {"modelId": "anthropic.claude-v2"}
+    assert controller.calls == [rate_control.estimate_text_tokens(body) + 4000]
+    assert controller.calls[0] > 4000 + 15000
+    assert client.meta == "meta"
@@ -0,0 +1,57 @@
+import io
+import json
+
+from utils import retrieval_cache
+from utils.multi_query import STOPWORDS
+
+VOCABULARY = ["warranty", "heater", "cylinder", "install", "panel", "price"]
+
+
+class FakeBedrock:
+    """
+    bedrock-runtime and bedrock-agent stand-in: embeds text as a bag of known keywords.
+    """
+
+    def __init__(self):
+        self.embedded = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        text = json.loads(body)["inputText"]
+        self.embedded.append(text)
+        words = {w.rstrip("s") for w in text.split() if w not in STOPWORDS}
+        embedding = [float(term in words) for term in VOCABULARY]
+        return {"body": io.BytesIO(json.dumps({"embedding": embedding}).encode("utf-8"))}
+
+    def list_data_sources(self, **kwargs):
+        return {"dataSourceSummaries": []}
+
+
+def test_paraphrase_is_a_semantic_hit(monkeypatch):
+    client = FakeBedrock()
+    monkeypatch.setattr(retrieval_cache, "get_client", lambda service_name, region_name=None: client)
+    monkeypatch.setattr(retrieval_cache, "_caches", {})
+    cache = retrieval_cache.get_retrieval_cache("us-east-1")
+
+    calls = []
+
+    def retrieve(query):
+        calls.append(query)
+        return [{"content": {"text": "Heaters carry a two-year warranty."}}]
+
+    first = cache.get_or_retrieve("KB1", None, "What is the warranty on the heater?", retrieve)
+    second = cache.get_or_retrieve("KB1", None, "heater warranty terms", retrieve)
+
+    assert second == first
+    assert calls == ["What is the warranty on the heater?"]
+    assert cache.stats()["semantic_hits"] == 1
+    assert len(client.embedded) == 2
+
+    cache.get_or_retrieve("KB1", None, "How do I install the panel?", retrieve)
+    assert len(calls) == 2
+
+
+def test_empty_embedding_model_disables_semantic_matching(monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "get_client", lambda service_name, region_name=None: FakeBedrock())
+    monkeypatch.setattr(retrieval_cache, "_caches", {})
+    monkeypatch.setenv("RETRIEVAL_CACHE_EMBEDDING_MODEL", "")
+    assert retrieval_cache.get_retrieval_cache().embed is None